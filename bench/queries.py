@@ -0,0 +1,400 @@
+"""Times the bot's SQL against a seeded local Postgres and checks the query plans.
+
+    python -m bench.queries --dsn postgres://localhost/nasa_bench
+
+A throwaway schema is created, migrated and filled with data at roughly the
+volumes a busy server builds up (scaled by ``--scale``). Every query in QUERIES is
+then timed, and each hot query's plan is checked with EXPLAIN, both as a custom
+plan and as the generic plan asyncpg's prepared statements end up with. The run
+fails if a hot query scans a whole table.
+
+QUERIES is a copy of the SQL on the bot's hot paths, the reads and writes that run
+for messages, modmail and errors, plus the few heavy reads worth watching. It isn't
+every query the bot runs. Keep it in sync with the SQL in utils/helpers.py,
+utils/level_manager.py, cogs/modmail.py, cogs/errorlog.py and cogs/levelling.py.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+import asyncpg
+
+from utils.migrations import migrate
+
+# Row counts at --scale 1
+VOLUMES = {
+    "levels": 50_000,
+    "moderationlog": 100_000,
+    "warnings": 20_000,
+    "muted": 20_000,
+    "modmail": 5_000,
+    "errorlog": 20_000,
+    "blacklist": 2_500,
+}
+
+NOW = int(time.time())
+
+
+@dataclass
+class BenchQuery:
+    name: str
+    sql: str
+    args: Callable[[random.Random, dict[str, int]], tuple[Any, ...]]
+    # Hot queries run for every message or command and must use an index
+    hot: bool = True
+    write: bool = False
+    timings: list[float] = field(default_factory=list)
+    seq_scans: list[str] = field(default_factory=list)
+
+
+def _user(rng: random.Random, volumes: dict[str, int]) -> tuple[int]:
+    return (rng.randint(1, volumes["levels"]),)
+
+
+def _thread(rng: random.Random, volumes: dict[str, int]) -> tuple[int]:
+    return (1_000_000 + rng.randint(1, volumes["modmail"]),)
+
+
+def _error(rng: random.Random, volumes: dict[str, int]) -> tuple[int, str, str, str]:
+    # Mostly repeats of a seeded error, which take the ON CONFLICT path
+    n = rng.randint(1, volumes["errorlog"] * 2)
+    fingerprint = hashlib.md5(str(n).encode()).hexdigest()
+    return (
+        NOW,
+        f"Traceback (most recent call last):\nKeyError{n}",
+        "command",
+        fingerprint,
+    )
+
+
+QUERIES = [
+    # utils/level_manager.py
+    BenchQuery("levels by id", "SELECT * FROM levels WHERE id=$1", _user),
+    BenchQuery(
+        "levels count message",
+        "UPDATE levels SET messages = messages + 1 WHERE id=$1",
+        _user,
+        write=True,
+    ),
+    BenchQuery(
+        "levels grant xp",
+        "UPDATE levels SET messages = messages + 1, overflow_xp=$1, level=$2, last_gained=$3 WHERE id=$4",
+        lambda rng, v: (rng.randint(0, 100), rng.randint(0, 50), NOW, _user(rng, v)[0]),
+        write=True,
+    ),
+    BenchQuery(
+        "levels insert",
+        "INSERT INTO levels (id, overflow_xp, last_gained) VALUES ($1, $2, $3) RETURNING *",
+        lambda rng, v: (v["levels"] + rng.randint(1, 1_000_000), 0, NOW),
+        write=True,
+    ),
+    BenchQuery("xp_blocked", "SELECT * FROM xp_blocked", lambda rng, v: (), hot=False),
+    # cogs/levelling.py, ranks every member so it can't avoid reading the table
+    BenchQuery(
+        "levels rank",
+        """
+        WITH retained AS (
+            SELECT * FROM levels ORDER BY level DESC, overflow_xp DESC
+        ),
+        ranked AS (
+            SELECT *, row_number() over () AS rank FROM retained
+        )
+        SELECT * FROM ranked WHERE id=$1
+        """,
+        _user,
+        hot=False,
+    ),
+    # cogs/modmail.py
+    BenchQuery(
+        "modmail thread by user",
+        "SELECT thread_id FROM modmail WHERE user_id = $1",
+        lambda rng, v: (rng.randint(1, v["modmail"]),),
+    ),
+    BenchQuery(
+        "modmail user by thread",
+        "SELECT user_id FROM modmail WHERE thread_id=$1",
+        _thread,
+    ),
+    BenchQuery(
+        "modmail open",
+        "INSERT INTO modmail (user_id, thread_id) VALUES ($1, $2) ON CONFLICT (user_id) DO UPDATE SET thread_id = $2",
+        lambda rng, v: (
+            rng.randint(1, v["modmail"] * 2),
+            2_000_000 + rng.randint(1, 1_000_000),
+        ),
+        write=True,
+    ),
+    BenchQuery(
+        "modmail close",
+        "DELETE FROM modmail WHERE thread_id = $1 RETURNING user_id",
+        _thread,
+        write=True,
+    ),
+    BenchQuery(
+        "modmail transcript",
+        "INSERT INTO modmail_transcripts (thread_id, user_id, path, message_count, closed_by, created_at) VALUES ($1, $2, $3, $4, $5, $6)",
+        lambda rng, v: (
+            _thread(rng, v)[0],
+            rng.randint(1, v["modmail"]),
+            "transcripts/bench.jsonl.gz",
+            rng.randint(1, 500),
+            1,
+            NOW,
+        ),
+        write=True,
+    ),
+    # cogs/errorlog.py
+    BenchQuery(
+        "errorlog create",
+        """
+        INSERT INTO errorlog (unixtimestamp, traceback, item, fingerprint, last_seen)
+        VALUES ($1, $2, $3, $4, $1)
+        ON CONFLICT (fingerprint) DO UPDATE
+            SET occurrences = errorlog.occurrences + 1, last_seen = EXCLUDED.last_seen
+        RETURNING id, unixtimestamp, traceback, item, fingerprint, occurrences, last_seen
+        """,
+        _error,
+        write=True,
+    ),
+    BenchQuery(
+        "errorlog by id",
+        "SELECT id, unixtimestamp, traceback, item, fingerprint, occurrences, last_seen FROM errorlog WHERE id=$1",
+        lambda rng, v: (rng.randint(1, v["errorlog"]),),
+    ),
+    BenchQuery(
+        "errorlog recent",
+        "SELECT id, unixtimestamp, item, occurrences, last_seen FROM errorlog ORDER BY COALESCE(last_seen, unixtimestamp) DESC LIMIT $1",
+        lambda rng, v: (10,),
+    ),
+    BenchQuery(
+        "errorlog search",
+        "SELECT id, unixtimestamp, item, occurrences, last_seen FROM errorlog WHERE search @@ websearch_to_tsquery('simple', $1) ORDER BY ts_rank(search, websearch_to_tsquery('simple', $1)) DESC, id DESC LIMIT $2",
+        lambda rng, v: (f"KeyError{rng.randint(1, 500)}", 10),
+    ),
+    # utils/helpers.py
+    BenchQuery(
+        "moderationlog by moderatee",
+        "SELECT * FROM moderationlog WHERE moderatee_id=$1 ORDER BY unixtimestamp DESC",
+        _user,
+    ),
+    BenchQuery(
+        "moderationlog by moderator",
+        "SELECT * FROM moderationlog WHERE moderator_id=$1 ORDER BY unixtimestamp DESC LIMIT 10",
+        lambda rng, v: (rng.randint(1, 50),),
+    ),
+    BenchQuery(
+        "moderationlog insert",
+        "INSERT INTO moderationlog (moderator_id, unixtimestamp, action, reason, moderatee_id) VALUES ($1, $2, $3, $4, $5) RETURNING *",
+        lambda rng, v: (rng.randint(1, 50), NOW, "warn", "bench", _user(rng, v)[0]),
+        write=True,
+    ),
+    BenchQuery(
+        "moderationlog by id",
+        "SELECT * FROM moderationlog WHERE entry_id=$1",
+        lambda rng, v: (rng.randint(1, v["moderationlog"]),),
+    ),
+    BenchQuery(
+        "warnings count", "SELECT count(*) FROM warnings WHERE user_id=$1", _user
+    ),
+    BenchQuery(
+        "warnings by id",
+        "SELECT * FROM warnings WHERE warning_id=$1",
+        lambda rng, v: (rng.randint(1, v["warnings"]),),
+    ),
+    BenchQuery(
+        "muted next",
+        "SELECT * FROM muted WHERE expires > $1 AND NOT expired ORDER BY expires DESC LIMIT 1",
+        lambda rng, v: (NOW,),
+    ),
+    BenchQuery(
+        "muted active by user", "SELECT * FROM muted WHERE id=$1 AND NOT expired", _user
+    ),
+    BenchQuery("blacklist by id", "SELECT * FROM blacklist WHERE id=$1", _user),
+    # src/bot.py, once at startup
+    BenchQuery("immune", "SELECT * FROM immune", lambda rng, v: (), hot=False),
+]
+
+
+def _seed_sql(volumes: dict[str, int]) -> list[str]:
+    return [
+        f"""
+        INSERT INTO levels (id, level, overflow_xp, last_gained, messages)
+        SELECT g, (random() * 50)::int, (random() * 1000)::int, {NOW} - (random() * 86400 * 90)::int, (random() * 5000)::int
+        FROM generate_series(1, {volumes['levels']}) g
+        """,
+        f"""
+        INSERT INTO moderationlog (moderator_id, unixtimestamp, action, reason, moderatee_id)
+        SELECT 1 + (random() * 49)::int, {NOW} - (random() * 86400 * 365)::int,
+            (ARRAY['warn', 'mute', 'kick', 'ban'])[1 + (random() * 3)::int], 'reason ' || g,
+            1 + (random() * {volumes['levels'] - 1})::int
+        FROM generate_series(1, {volumes['moderationlog']}) g
+        """,
+        f"""
+        INSERT INTO warnings (user_id, reason, unixtimestamp)
+        SELECT 1 + (random() * {volumes['levels'] - 1})::int, 'reason ' || g, {NOW} - (random() * 86400 * 365)::int
+        FROM generate_series(1, {volumes['warnings']}) g
+        """,
+        # Almost every mute has run out, a handful are still active
+        f"""
+        INSERT INTO muted (id, reason, duration, expires, expired)
+        SELECT 1 + (random() * {volumes['levels'] - 1})::int, 'reason ' || g, 3600,
+            {NOW} + (random() * 86400 * 2 - 86400 * (g % 50 <> 0)::int * 365)::int, g % 50 <> 0
+        FROM generate_series(1, {volumes['muted']}) g
+        """,
+        f"""
+        INSERT INTO modmail (user_id, thread_id)
+        SELECT g, 1000000 + g FROM generate_series(1, {volumes['modmail']}) g
+        """,
+        f"""
+        INSERT INTO errorlog (unixtimestamp, traceback, item, fingerprint, occurrences, last_seen)
+        SELECT {NOW} - (random() * 86400 * 365)::int,
+            E'Traceback (most recent call last):\\n  File "cogs/x.py", line ' || g || E'\\nKeyError' || (g % 500),
+            'command' || (g % 40), md5(g::text), 1 + (random() * 20)::int, {NOW} - (random() * 86400 * 30)::int
+        FROM generate_series(1, {volumes['errorlog']}) g
+        """,
+        f"""
+        INSERT INTO blacklist (id, moderator_id, added_at)
+        SELECT g * 7, 1, {NOW} FROM generate_series(1, {volumes['blacklist']}) g
+        """,
+        "ANALYZE",
+    ]
+
+
+def _seq_scans(plan: dict[str, Any]) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", ()):
+        found.extend(_seq_scans(child))
+    return found
+
+
+async def _explain(
+    conn: asyncpg.Connection, query: BenchQuery, args: tuple
+) -> list[str]:
+    # plan_cache_mode only applies to prepared statements, so EXPLAIN an EXECUTE
+    await conn.execute(f"PREPARE bench_plan AS {query.sql}")
+    params = f"({', '.join(f'${i + 1}' for i in range(len(args)))})" if args else ""
+    scans = set()
+    try:
+        for mode in ("custom", "generic"):
+            await conn.execute(f"SET plan_cache_mode = force_{mode}_plan")
+            raw = await conn.fetchval(
+                f"EXPLAIN (FORMAT JSON) EXECUTE bench_plan{params}", *args
+            )
+            plan = json.loads(raw) if isinstance(raw, str) else raw
+            scans.update(
+                f"{table} ({mode} plan)" for table in _seq_scans(plan[0]["Plan"])
+            )
+    finally:
+        await conn.execute("RESET plan_cache_mode")
+        await conn.execute("DEALLOCATE bench_plan")
+    return sorted(scans)
+
+
+async def _time(
+    conn: asyncpg.Connection,
+    query: BenchQuery,
+    rng: random.Random,
+    volumes: dict[str, int],
+    iterations: int,
+):
+    stmt = await conn.prepare(query.sql)
+    for _ in range(iterations):
+        args = query.args(rng, volumes)
+        tr = conn.transaction()
+        await tr.start()
+        start = time.perf_counter()
+        await stmt.fetch(*args)
+        query.timings.append(time.perf_counter() - start)
+        # Writes are undone so every iteration sees the same data
+        await tr.rollback()
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def main(args: argparse.Namespace) -> int:
+    volumes = {table: max(1, int(rows * args.scale)) for table, rows in VOLUMES.items()}
+    schema = f"bench_{os.getpid()}"
+    rng = random.Random(args.seed)
+
+    admin = await asyncpg.connect(args.dsn)
+    await admin.execute(f"CREATE SCHEMA {schema}")
+    try:
+        async with asyncpg.create_pool(
+            args.dsn, min_size=1, max_size=1, server_settings={"search_path": schema}
+        ) as pool:
+            await migrate(pool)
+            async with pool.acquire() as conn:
+                start = time.perf_counter()
+                for sql in _seed_sql(volumes):
+                    await conn.execute(sql)
+                print(
+                    f"Seeded {sum(volumes.values())} rows in {time.perf_counter() - start:.1f}s\n"
+                )
+
+                for query in QUERIES:
+                    if query.hot:
+                        query.seq_scans = await _explain(
+                            conn, query, query.args(rng, volumes)
+                        )
+                    await _time(conn, query, rng, volumes, args.iterations)
+    finally:
+        if args.keep:
+            print(f"Kept schema {schema}")
+        else:
+            await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
+
+    failed = 0
+    print(f"{'Query':<30} {'Hot':>4} {'p50':>9} {'p95':>9}  Plan")
+    for query in QUERIES:
+        plan = "-"
+        if query.hot:
+            plan = (
+                f"SEQ SCAN on {', '.join(query.seq_scans)}" if query.seq_scans else "ok"
+            )
+            failed += bool(query.seq_scans)
+        print(
+            f"{query.name:<30} {'yes' if query.hot else 'no':>4} "
+            f"{_percentile(query.timings, 0.5) * 1000:>7.2f}ms {_percentile(query.timings, 0.95) * 1000:>7.2f}ms  {plan}"
+        )
+
+    if failed:
+        print(
+            f"\n{failed} hot quer{'y' if failed == 1 else 'ies'} scanned a whole table"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.queries", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument(
+        "--dsn",
+        default=os.environ.get("BENCH_DSN", "postgres://localhost/nasa_bench"),
+        help="A database the benchmark can create a schema in ($BENCH_DSN)",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplier for the seeded row counts"
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--keep", action="store_true", help="Don't drop the schema afterwards"
+    )
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,248 @@
+"""Replays a gateway recording through NASABot without Discord or Postgres.
+
+Record a session by setting ``gateway_record_file`` in config.json, then run::
+
+    python -m bench.replay recording.jsonl.gz --speed 10
+
+READY and the GUILD_CREATE events after it are fed in first so the cache is warm
+when the extensions load, then the rest of the recording is replayed at
+``--speed`` times the recorded rate (0 replays as fast as possible). The REST
+client, the aiohttp session and the asyncpg pool are replaced by the stubs in
+``bench/stubs.py``, so nothing leaves the process.
+
+The report shows event throughput, the latency from an event being parsed to
+every listener it triggered finishing, and the REST, HTTP and database calls that
+were made.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from typing import Any
+
+import discord
+
+import utils
+from src.bot import NASABot
+
+from .stubs import StubPool, StubScheduler, StubSession, stub_http
+
+log = logging.getLogger("bench.replay")
+
+_SESSION_START = {"READY", "GUILD_CREATE"}
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Replayer:
+    def __init__(self, bot: NASABot, *, speed: float):
+        self.bot = bot
+        self.speed = speed
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.unhandled: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.elapsed = 0.0
+
+        # Collect the listener tasks each event schedules so we can wait for them
+        self._collecting: list[asyncio.Task[Any]] | None = None
+        schedule = bot._schedule_event
+
+        def _schedule_event(*args: Any, **kwargs: Any) -> asyncio.Task[Any]:
+            task = schedule(*args, **kwargs)
+            if self._collecting is not None:
+                self._collecting.append(task)
+            return task
+
+        bot._schedule_event = _schedule_event  # type: ignore
+
+    def feed(self, event: utils.RecordedEvent) -> list[asyncio.Task[Any]]:
+        parser = self.bot._connection.parsers.get(event.type)
+        if parser is None:
+            self.unhandled[event.type] += 1
+            return []
+
+        self._collecting = tasks = []
+        try:
+            parser(event.data)
+        except Exception:
+            self.errors[event.type] += 1
+            log.exception(f"Parsing {event.type} failed")
+        finally:
+            self._collecting = None
+        return tasks
+
+    async def _finish(self, type: str, started: float, tasks: list[asyncio.Task[Any]]):
+        if tasks:
+            await asyncio.wait(tasks)
+        self.latencies[type].append(time.perf_counter() - started)
+
+    async def replay(self, events: list[utils.RecordedEvent]):
+        if not events:
+            return
+
+        pending = []
+        first = events[0].offset
+        start = time.perf_counter()
+        for event in events:
+            if self.speed:
+                delay = (event.offset - first) / self.speed - (
+                    time.perf_counter() - start
+                )
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            started = time.perf_counter()
+            tasks = self.feed(event)
+            pending.append(
+                asyncio.create_task(self._finish(event.type, started, tasks))
+            )
+            # Give the listeners a chance to run, as reading the socket would
+            await asyncio.sleep(0)
+
+        await asyncio.gather(*pending)
+        self.elapsed = time.perf_counter() - start
+
+
+def _report(
+    replayer: Replayer, rest: Counter[str], pool: StubPool, session: StubSession
+) -> dict[str, Any]:
+    total = sum(len(v) for v in replayer.latencies.values())
+    return {
+        "events": total,
+        "seconds": round(replayer.elapsed, 4),
+        "events_per_second": (
+            round(total / replayer.elapsed, 1) if replayer.elapsed else 0
+        ),
+        "latency": {
+            t: {
+                "count": len(v),
+                "p50_ms": round(_percentile(v, 0.5) * 1000, 3),
+                "p95_ms": round(_percentile(v, 0.95) * 1000, 3),
+                "max_ms": round(max(v) * 1000, 3),
+            }
+            for t, v in sorted(replayer.latencies.items())
+        },
+        "unhandled": dict(replayer.unhandled),
+        "errors": dict(replayer.errors),
+        "rest_calls": dict(rest.most_common()),
+        "http_calls": dict(session.calls.most_common()),
+        "db_calls": dict(pool.calls.most_common()),
+    }
+
+
+def _print_report(report: dict[str, Any]):
+    print(
+        f"Replayed {report['events']} events in {report['seconds']:.2f}s "
+        f"({report['events_per_second']} events/s)\n"
+    )
+    print(f"{'Event':<32} {'Count':>7} {'p50':>10} {'p95':>10} {'Max':>10}")
+    for t, s in report["latency"].items():
+        print(
+            f"{t:<32} {s['count']:>7} {s['p50_ms']:>8.2f}ms {s['p95_ms']:>8.2f}ms {s['max_ms']:>8.2f}ms"
+        )
+
+    for title, key in (
+        ("REST calls", "rest_calls"),
+        ("HTTP calls", "http_calls"),
+        ("Database calls", "db_calls"),
+        ("Events without a parser", "unhandled"),
+        ("Events that failed to parse", "errors"),
+    ):
+        if report[key]:
+            print(f"\n{title}:")
+            for name, count in report[key].items():
+                print(f"  {count:>7}  {name}")
+
+
+async def main(args: argparse.Namespace):
+    events = list(utils.read_recording(args.recording))
+    split = 0
+    while split < len(events) and events[split].type in _SESSION_START:
+        split += 1
+    if not split or events[0].type != "READY":
+        raise SystemExit("The recording has to start with READY")
+
+    config = utils.Configuration.get_config(args.config)
+    # Don't serve metrics or record the replay
+    config.metrics_port = None
+    config.gateway_record_file = None
+
+    # The bot is auto-sharded and is only ready once every shard it runs has sent a
+    # READY, so it runs the recorded shards. Recordings without a shard are shard 0.
+    shards = [
+        event.data.setdefault("shard", [0, 1])
+        for event in events[:split]
+        if event.type == "READY"
+    ]
+    shard_ids = sorted({shard_id for shard_id, _ in shards})
+    shard_count = max(count for _, count in shards)
+
+    pool = StubPool()
+    session = StubSession()
+    bot = NASABot(  # type: ignore
+        pool, session, config, shard_ids=shard_ids, shard_count=shard_count
+    )
+    rest = stub_http(bot, latency=args.rest_latency)
+    # Jobs run on a timer rather than in response to events
+    bot.scheduler = StubScheduler()
+
+    state = bot._connection
+    # launch_shards() fills this in, which there's no gateway for
+    state.shard_ids = shard_ids
+    # There's no websocket to request members over
+    state._chunk_guilds = False
+    state.guild_ready_timeout = 0.1
+
+    replayer = Replayer(bot, speed=args.speed)
+    async with bot:
+        await replayer.replay(events[:split])
+        await bot.setup_hook()
+        await bot.wait_until_ready()
+
+        # Only count what the replayed traffic causes
+        rest.clear()
+        session.calls.clear()
+        pool.calls.clear()
+        replayer.latencies.clear()
+
+        await replayer.replay(events[split:])
+
+    report = _report(replayer, rest, pool, session)
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(report, fp, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.replay", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("recording", help="A file written by the gateway recorder")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="Multiple of the recorded rate, 0 is as fast as possible",
+    )
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument(
+        "--rest-latency",
+        type=float,
+        default=0.0,
+        help="Seconds each stubbed REST call takes",
+    )
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    args = parser.parse_args()
+
+    discord.utils.setup_logging(level=logging.INFO if args.verbose else logging.WARNING)
+    asyncio.run(main(args))
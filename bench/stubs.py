@@ -0,0 +1,229 @@
+"""Local stand-ins for the database, the Discord REST API and aiohttp, so the bot
+can be driven offline by the benchmarks.
+
+Every stub counts the calls made to it, which the benchmarks report.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Any, AsyncIterator
+
+import discord
+
+import utils
+
+__all__ = ("StubPool", "StubScheduler", "StubSession", "stub_http")
+
+_ids = itertools.count(int(time.time() * 1000 - 1420070400000) << 22)
+
+
+class _StubTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class StubConnection:
+    """Answers every query with an empty result"""
+
+    def __init__(self, calls: Counter[str]):
+        self.calls = calls
+
+    def _count(self, method: str, query: str):
+        # Collapse whitespace so the same query always counts as one
+        self.calls[f"{method}: {' '.join(query.split())[:80]}"] += 1
+
+    async def fetch(self, query: str, *args: Any) -> list[Any]:
+        self._count("fetch", query)
+        return []
+
+    async def fetchrow(self, query: str, *args: Any) -> None:
+        self._count("fetchrow", query)
+        return None
+
+    async def fetchval(self, query: str, *args: Any) -> None:
+        self._count("fetchval", query)
+        return None
+
+    async def execute(self, query: str, *args: Any) -> str:
+        self._count("execute", query)
+        return "OK"
+
+    async def executemany(self, query: str, args: Any) -> None:
+        self._count("executemany", query)
+
+    def transaction(self) -> _StubTransaction:
+        return _StubTransaction()
+
+    def add_query_logger(self, callback: Any):
+        pass
+
+
+class _Acquire:
+    def __init__(self, conn: StubConnection):
+        self.conn = conn
+
+    async def __aenter__(self) -> StubConnection:
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class StubPool(StubConnection):
+    """An ``asyncpg.Pool`` stand-in, see :class:`StubConnection`"""
+
+    def __init__(self):
+        super().__init__(Counter())
+
+    def acquire(self) -> _Acquire:
+        return _Acquire(StubConnection(self.calls))
+
+    async def close(self):
+        pass
+
+
+class StubScheduler(utils.Scheduler):
+    """A :class:`utils.Scheduler` that accepts jobs but never runs them, since the
+    stub pool has no table to keep them in"""
+
+    def __init__(self):
+        super().__init__(StubPool())  # type: ignore
+
+    async def schedule(self, name: str, **kwargs: Any) -> utils.Job:  # type: ignore
+        return utils.Job(0, name, "", {}, round(time.time()), kwargs.get("interval"))
+
+    async def every(self, name: str, interval: float, **kwargs: Any) -> utils.Job:
+        return utils.Job(0, name, "", {}, round(time.time()), round(interval))
+
+    def start(self):
+        pass
+
+
+class _StubContent:
+    async def iter_chunked(self, size: int) -> AsyncIterator[bytes]:
+        yield b""
+
+
+class StubResponse:
+    status = 200
+    headers: dict[str, str] = {}
+    content = _StubContent()
+
+    async def __aenter__(self) -> StubResponse:
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __await__(self):
+        async def _self():
+            return self
+
+        return _self().__await__()
+
+    def raise_for_status(self):
+        pass
+
+    async def read(self) -> bytes:
+        return b""
+
+    async def text(self, *args: Any, **kwargs: Any) -> str:
+        return ""
+
+    async def json(self, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        return {}
+
+    def close(self):
+        pass
+
+    def release(self):
+        pass
+
+
+class StubSession:
+    """An ``aiohttp.ClientSession`` stand-in that answers everything with an empty 200"""
+
+    closed = False
+
+    def __init__(self):
+        self.calls: Counter[str] = Counter()
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> StubResponse:
+        self.calls[f"{method} {url}"] += 1
+        return StubResponse()
+
+    def get(self, url: str, **kwargs: Any) -> StubResponse:
+        return self._request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> StubResponse:
+        return self._request("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs: Any) -> StubResponse:
+        return self._request(method, url, **kwargs)
+
+    async def close(self):
+        pass
+
+
+def _fake_message(bot: discord.Client, channel_id: str, payload: dict[str, Any]):
+    user = bot.user
+    return {
+        "id": str(next(_ids)),
+        "channel_id": channel_id,
+        "type": 0,
+        "content": payload.get("content") or "",
+        "author": {
+            "id": str(user.id) if user else "0",
+            "username": user.name if user else "bot",
+            "discriminator": "0",
+            "avatar": None,
+        },
+        "embeds": payload.get("embeds") or [],
+        "attachments": [],
+        "mentions": [],
+        "mention_roles": [],
+        "mention_everyone": False,
+        "pinned": False,
+        "tts": False,
+        "timestamp": discord.utils.utcnow().isoformat(),
+        "edited_timestamp": None,
+    }
+
+
+def stub_http(bot: discord.Client, *, latency: float = 0.0) -> Counter[str]:
+    """Replaces the bot's REST client with one that never leaves the process.
+
+    Sending a message returns a message built from the request, everything else
+    returns an empty object. The returned counter is keyed by ``METHOD /route``.
+
+    Parameters
+    ----------
+    bot: `discord.Client`
+        The bot to patch
+    latency: `float`
+        Seconds each request pretends to take
+    """
+    calls: Counter[str] = Counter()
+
+    async def request(route: discord.http.Route, **kwargs: Any) -> Any:
+        calls[f"{route.method} {route.path}"] += 1
+        if latency:
+            await asyncio.sleep(latency)
+
+        if route.method == "POST" and route.path == "/channels/{channel_id}/messages":
+            payload = kwargs.get("json") or {}
+            for part in kwargs.get("form") or ():
+                if part.get("name") == "payload_json":
+                    payload = discord.utils._from_json(part["value"])
+            return _fake_message(bot, str(route.channel_id), payload)
+        return {}
+
+    bot.http.request = request  # type: ignore
+    return calls
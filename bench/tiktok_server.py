@@ -0,0 +1,175 @@
+"""A local stand-in for TikTok profile pages, to check the follower poller against.
+
+    python -m bench.tiktok_server --check
+
+Serves ``/@<username>`` as a page of ``--size`` bytes with the follower count
+``--position`` of the way through, answering conditional requests with a 304 while
+the count is unchanged. ``/@broken`` has no count and ``/@error`` returns a 500.
+
+With ``--check`` the server is started on a free port, ``utils.TikTokPoller`` is run
+against each case and the script exits with 1 if any of them went wrong. Without it
+the server runs until interrupted, e.g. to point ``TikTokPoller.base_url`` at.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import sys
+from email.utils import formatdate
+
+import aiohttp
+from aiohttp import web
+
+import utils
+
+_FILLER = b"<div class='filler'>" + b"x" * 1000 + b"</div>\n"
+
+
+class StubTikTok:
+    def __init__(self, *, count: str, size: int, position: float):
+        self.count = count
+        self.size = size
+        self.position = position
+        self.requests = 0
+        self.not_modified = 0
+        self.modified = formatdate(usegmt=True)
+
+    def _page(self, count: str | None) -> bytes:
+        marker = (
+            b""
+            if count is None
+            else f'<strong title="Followers" data-e2e="followers-count">{count}</strong>'.encode()
+        )
+        filler = _FILLER * (self.size // len(_FILLER) + 1)
+        split = int(self.size * self.position)
+        return b"<html><body>" + filler[:split] + marker + filler[split : self.size]
+
+    @property
+    def etag(self) -> str:
+        return '"' + hashlib.sha1(self.count.encode()).hexdigest() + '"'
+
+    def set_count(self, count: str):
+        self.count = count
+        self.modified = formatdate(usegmt=True)
+
+    async def profile(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        username = request.match_info["username"]
+        if username == "error":
+            return web.Response(status=500)
+
+        count = None if username == "broken" else self.count
+        if count is not None and request.headers.get("If-None-Match") == self.etag:
+            self.not_modified += 1
+            return web.Response(status=304)
+
+        response = web.StreamResponse(
+            headers={
+                "Content-Type": "text/html; charset=utf-8",
+                "ETag": self.etag,
+                "Last-Modified": self.modified,
+            }
+        )
+        await response.prepare(request)
+        page = self._page(count)
+        try:
+            for start in range(0, len(page), 16 * 1024):
+                await response.write(page[start : start + 16 * 1024])
+        except ConnectionResetError:
+            # The poller hangs up once it has the count
+            pass
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/@{username}", self.profile)
+        return app
+
+
+async def check(stub: StubTikTok) -> bool:
+    runner = web.AppRunner(stub.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    ok = True
+
+    def expect(name: str, passed: bool, detail: str):
+        nonlocal ok
+        ok &= passed
+        print(f"{'PASS' if passed else 'FAIL'}  {name}: {detail}")
+
+    async with aiohttp.ClientSession() as session:
+        poller = utils.TikTokPoller(session, "someone", base_url=base_url)
+
+        count = await poller.poll()
+        expect(
+            "first poll",
+            count == stub.count,
+            f"{count!r} after reading {poller.bytes_read} of {stub.size} bytes",
+        )
+
+        requests = stub.not_modified
+        count = await poller.poll()
+        expect(
+            "unchanged",
+            count == stub.count and stub.not_modified == requests + 1,
+            f"{count!r} from a 304",
+        )
+
+        stub.set_count("12.5K")
+        count = await poller.poll()
+        expect("changed", count == "12.5K", f"{count!r}")
+
+        for username in ("broken", "error"):
+            poller = utils.TikTokPoller(
+                session, username, base_url=base_url, max_bytes=stub.size // 2
+            )
+            try:
+                count = await poller.poll()
+            except utils.TikTokError as e:
+                expect(username, True, str(e))
+            else:
+                expect(username, False, f"returned {count!r}")
+
+        poller = utils.TikTokPoller(session, "someone", base_url="http://127.0.0.1:9")
+        try:
+            await poller.poll()
+        except utils.TikTokError as e:
+            expect("unreachable", True, str(e))
+        else:
+            expect("unreachable", False, "didn't raise")
+
+    await runner.cleanup()
+    print(f"\n{stub.requests} requests, {stub.not_modified} answered with a 304")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.tiktok_server", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--count", default="1.2M", help="The follower count to serve")
+    parser.add_argument("--size", type=int, default=2 * 1024 * 1024)
+    parser.add_argument(
+        "--position",
+        type=float,
+        default=0.1,
+        help="How far through the page the count is, from 0 to 1",
+    )
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    stub = StubTikTok(count=args.count, size=args.size, position=args.position)
+    if args.check:
+        sys.exit(0 if asyncio.run(check(stub)) else 1)
+    web.run_app(stub.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
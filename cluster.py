@@ -0,0 +1,348 @@
+"""Runs the bot's shards in several processes and restarts the ones that crash.
+
+    python cluster.py --clusters 2
+
+The shard count comes from Discord unless ``--shards`` is given, and the shards are
+split into contiguous groups, one process each. Every process opens its own
+database pool, so ``db_pool_size`` is divided between them. The first cluster also
+loads the extensions that should only run once, see ``NASABot.SINGLETON_EXTENSIONS``.
+
+Processes talk to each other through this one: a request from a cluster is sent
+on to its target, or to every cluster, and the answers are sent back together.
+See ``utils.ClusterClient`` for the messages.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection, wait
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+import discord
+
+import utils
+
+log = logging.getLogger("NASA.supervisor")
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+MAX_BACKOFF = 60.0  # Seconds between restarts of a cluster that keeps crashing
+STABLE_AFTER = 300.0  # Seconds a cluster has to run before its failures are forgotten
+SHUTDOWN_TIMEOUT = 15.0
+
+
+def recommended_shards(token: str) -> int:
+    request = urllib.request.Request(
+        GATEWAY_URL,
+        headers={
+            "Authorization": f"Bot {token}",
+            "User-Agent": "DiscordBot (NASA cluster supervisor)",
+        },
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+
+def run_cluster(
+    cluster_id: int,
+    cluster_count: int,
+    shard_ids: list[int],
+    shard_count: int,
+    pool_size: int,
+    config_path: str,
+    conn: Connection,
+):
+    # Runs in the child process, which stops on SIGINT even if it was started in
+    # the background with SIGINT ignored
+    import start
+
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    config = utils.Configuration.get_config(config_path)
+    cluster = utils.ClusterClient(conn, cluster_id, cluster_count)
+    log.info(f"Cluster {cluster_id} starting with shards {shard_ids}")
+    try:
+        asyncio.run(
+            start.run(
+                config,
+                pool_size=pool_size,
+                shard_ids=shard_ids,
+                shard_count=shard_count,
+                cluster_id=cluster_id,
+                cluster=cluster,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+@dataclass
+class Cluster:
+    id: int
+    shard_ids: list[int]
+    process: BaseProcess | None = None
+    conn: Connection | None = None
+    started: float = 0.0
+    failures: int = 0
+    restart_at: float | None = None
+    # The pipe hit EOF, it stays readable so it's left out of the wait until the exit
+    hung_up: bool = False
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+@dataclass
+class PendingRequest:
+    origin: Cluster
+    request_id: int
+    waiting: set[int]
+    results: dict[int, Any] = field(default_factory=dict)
+
+
+class Supervisor:
+    """
+    Starts a process per cluster, routes their requests and restarts them when they exit
+    with an error. A cluster that exits cleanly stays down, and the supervisor stops once
+    every cluster has.
+
+    Parameters
+    ----------
+    groups: `list[list[int]]`
+        The shard ids each cluster runs
+    shard_count: `int`
+        The total number of shards
+    pool_size: `int`
+        Database connections for each cluster
+    config_path: `str`
+        The config file the clusters load
+    """
+
+    def __init__(
+        self,
+        groups: list[list[int]],
+        shard_count: int,
+        pool_size: int,
+        config_path: str = "config.json",
+    ):
+        self.clusters = [Cluster(i, shards) for i, shards in enumerate(groups)]
+        self.shard_count = shard_count
+        self.pool_size = pool_size
+        self.config_path = config_path
+
+        self._context = multiprocessing.get_context("spawn")
+        self._pending: dict[int, PendingRequest] = {}
+        self._ids = itertools.count()
+        self._stopping = False
+
+    def spawn(self, cluster: Cluster):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=run_cluster,
+            args=(
+                cluster.id,
+                len(self.clusters),
+                cluster.shard_ids,
+                self.shard_count,
+                self.pool_size,
+                self.config_path,
+                child,
+            ),
+            name=f"cluster-{cluster.id}",
+        )
+        process.start()
+        child.close()
+
+        cluster.process = process
+        cluster.conn = parent
+        cluster.started = time.monotonic()
+        cluster.restart_at = None
+        cluster.hung_up = False
+
+    def _send(self, cluster: Cluster, message: dict[str, Any]):
+        if cluster.conn is None:
+            return
+        try:
+            cluster.conn.send(message)
+        except (BrokenPipeError, OSError):
+            # Its exit is handled when the sentinel fires
+            pass
+
+    def _complete(self, supervisor_id: int):
+        pending = self._pending.pop(supervisor_id)
+        self._send(
+            pending.origin,
+            {"op": "response", "id": pending.request_id, "results": pending.results},
+        )
+
+    def _route(self, cluster: Cluster, message: dict[str, Any]):
+        op = message.get("op")
+        if op == "request":
+            target = message["target"]
+            targets = [
+                c
+                for c in self.clusters
+                if c.alive and (target is None or c.id == target)
+            ]
+            supervisor_id = next(self._ids)
+            self._pending[supervisor_id] = PendingRequest(
+                cluster, message["id"], {c.id for c in targets}
+            )
+            for c in targets:
+                self._send(c, {**message, "id": supervisor_id})
+            if not targets:
+                self._complete(supervisor_id)
+        elif op == "reply":
+            pending = self._pending.get(message["id"])
+            if pending is None or cluster.id not in pending.waiting:
+                return
+            pending.waiting.discard(cluster.id)
+            pending.results[cluster.id] = message["result"]
+            if not pending.waiting:
+                self._complete(message["id"])
+        else:
+            log.warning(f"Unknown message {op!r} from cluster {cluster.id}")
+
+    def _exited(self, cluster: Cluster):
+        assert cluster.process is not None
+        # The sentinel can fire just before the process is reaped
+        cluster.process.join()
+        code = cluster.process.exitcode
+        if cluster.conn is not None:
+            cluster.conn.close()
+        cluster.process = None
+        cluster.conn = None
+
+        # Nobody is going to answer for this cluster any more
+        for supervisor_id, pending in list(self._pending.items()):
+            if pending.origin is cluster:
+                del self._pending[supervisor_id]
+            elif cluster.id in pending.waiting:
+                pending.waiting.discard(cluster.id)
+                if not pending.waiting:
+                    self._complete(supervisor_id)
+
+        if self._stopping or code == 0:
+            log.info(f"Cluster {cluster.id} exited")
+            return
+
+        if time.monotonic() - cluster.started > STABLE_AFTER:
+            cluster.failures = 0
+        delay = min(MAX_BACKOFF, 2.0**cluster.failures)
+        cluster.failures += 1
+        cluster.restart_at = time.monotonic() + delay
+        log.warning(
+            f"Cluster {cluster.id} exited with code {code}, restarting in {delay:.0f}s"
+        )
+
+    def run(self):
+        for cluster in self.clusters:
+            self.spawn(cluster)
+
+        while any(c.alive or c.restart_at is not None for c in self.clusters):
+            now = time.monotonic()
+            for cluster in self.clusters:
+                if cluster.restart_at is not None and cluster.restart_at <= now:
+                    self.spawn(cluster)
+
+            restarts = [c.restart_at for c in self.clusters if c.restart_at is not None]
+            timeout = max(0.0, min(restarts) - now) if restarts else None
+
+            objects: dict[Any, tuple[str, Cluster]] = {}
+            for cluster in self.clusters:
+                if cluster.process is not None and cluster.conn is not None:
+                    if not cluster.hung_up:
+                        objects[cluster.conn] = ("conn", cluster)
+                    objects[cluster.process.sentinel] = ("exit", cluster)
+
+            for ready in wait(list(objects), timeout):
+                kind, cluster = objects[ready]
+                if kind == "exit":
+                    # Read anything it sent before it went
+                    while cluster.conn is not None and cluster.conn.poll():
+                        try:
+                            self._route(cluster, cluster.conn.recv())
+                        except (EOFError, OSError):
+                            break
+                    self._exited(cluster)
+                elif cluster.conn is not None:
+                    try:
+                        message = cluster.conn.recv()
+                    except (EOFError, OSError):
+                        # Waiting on it again would return straight away until the
+                        # sentinel fires, so only wait on the sentinel from now on
+                        cluster.hung_up = True
+                        continue
+                    self._route(cluster, message)
+
+    def stop(self, *, interrupt: bool):
+        """Asks every cluster to shut down, killing the ones that take too long"""
+        self._stopping = True
+        for cluster in self.clusters:
+            if cluster.alive and interrupt:
+                assert cluster.process is not None and cluster.process.pid
+                os.kill(cluster.process.pid, signal.SIGINT)
+
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for cluster in self.clusters:
+            if cluster.process is None:
+                continue
+            cluster.process.join(max(0.0, deadline - time.monotonic()))
+            if cluster.process.is_alive():
+                log.warning(f"Cluster {cluster.id} didn't stop in time, killing it")
+                cluster.process.kill()
+                cluster.process.join()
+
+
+def _terminate(signum: int, frame: Any):
+    raise SystemExit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        help="Processes to run, defaults to the clusters config value",
+    )
+    parser.add_argument(
+        "--shards", type=int, help="Total shards, defaults to Discord's recommendation"
+    )
+    parser.add_argument("--config", default="config.json")
+    args = parser.parse_args()
+
+    discord.utils.setup_logging()
+    config = utils.Configuration.get_config(args.config)
+
+    shard_count = args.shards or recommended_shards(config.token)  # type: ignore
+    groups = utils.split_shards(shard_count, args.clusters or config.clusters)
+    pool_size = max(2, config.db_pool_size // len(groups))
+    log.info(
+        f"Running {shard_count} shard(s) in {len(groups)} cluster(s) "
+        f"with {pool_size} database connection(s) each"
+    )
+
+    supervisor = Supervisor(groups, shard_count, pool_size, args.config)
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        # The terminal already sent SIGINT to the whole process group
+        supervisor.stop(interrupt=False)
+    except SystemExit:
+        supervisor.stop(interrupt=True)
+
+
+if __name__ == "__main__":
+    main()
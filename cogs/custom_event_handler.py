@@ -1,29 +1,195 @@
 import discord
 from discord.ext import commands
 
-from pprint import pprint
+import aiohttp
 
-from src.bot import NASABot
+import asyncio
+from collections import Counter
+from logging import getLogger
+
+from src.bot import NASABot, NASAContext
 from .errorlog import ErrorLog
 
+log = getLogger("cogs.custom_event_handler")
+
+
+class ErrorNotifier:
+    """Coalesces error notifications into digests sent through the error webhook.
+
+    The first occurrence of an error is sent straight away, repeats are buffered
+    and sent as a single digest once ``max_batch`` are waiting or ``flush_interval``
+    seconds have passed. Failed sends are retried with exponential backoff.
+    """
+
+    MAX_BUFFER = 500
+
+    def __init__(
+        self,
+        webhook: discord.Webhook,
+        *,
+        flush_interval: float = 30.0,
+        max_batch: int = 25,
+        max_retries: int = 5,
+    ):
+        self.webhook = webhook
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+
+        self._buffer: list[ErrorLog] = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._pending: set[asyncio.Task[None]] = set()
+        self._closing = False
+
+        # Counters
+        self.sent = 0
+        self.batched = 0
+        self.dropped = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._buffer)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="error-notifier")
+
+    async def close(self):
+        # Let the loop finish a flush it's in the middle of instead of cancelling it
+        self._closing = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def push(self, errorlog: ErrorLog):
+        if errorlog.is_new:
+            task = asyncio.create_task(self._send(1, embed=errorlog.embed))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+            return
+
+        self._buffer.append(errorlog)
+        if len(self._buffer) > self.MAX_BUFFER:
+            overflow = len(self._buffer) - self.MAX_BUFFER
+            del self._buffer[:overflow]
+            self.dropped += overflow
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Failed to flush error notifications")
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        self.batched += len(batch)
+        await self._send(len(batch), embed=self.digest_embed(batch))
+
+    @staticmethod
+    def digest_embed(batch: list[ErrorLog]) -> discord.Embed:
+        counts = Counter(e.id for e in batch)
+        latest: dict[int, ErrorLog] = {e.id: e for e in batch}
+
+        lines = []
+        for error_id, count in counts.most_common():
+            err = latest[error_id]
+            lines.append(f"`#{err.id}` {err.item}: +{count} (x{err.occurrences} total)")
+
+        description = ""
+        for i, line in enumerate(lines):
+            if len(description) + len(line) > 4000:
+                description += f"...and {len(lines) - i} more"
+                break
+            description += line + "\n"
+
+        return discord.Embed(
+            title=f"Error digest: {len(batch)} repeated errors",
+            description=description,
+            colour=discord.Colour.blue(),
+        )
+
+    async def _send(self, count: int, **kwargs) -> bool:
+        delay = 1.0
+        for attempt in range(self.max_retries):
+            try:
+                await self.webhook.send(**kwargs)
+            except (discord.NotFound, discord.Forbidden) as e:
+                log.error("Error webhook is unusable", exc_info=e)
+                break
+            except (
+                discord.HTTPException,
+                aiohttp.ClientError,
+                OSError,
+                asyncio.TimeoutError,
+            ) as e:
+                log.warning(
+                    f"Error webhook send failed (attempt {attempt + 1}/{self.max_retries})",
+                    exc_info=e,
+                )
+                await asyncio.sleep(delay)
+                delay *= 2
+            else:
+                self.sent += 1
+                return True
+
+        self.dropped += count
+        return False
+
 
 class CustomEventHandler(commands.Cog):
     def __init__(self, bot: NASABot):
         self.bot = bot
+        self.notifier: ErrorNotifier | None = None
+
+    async def cog_load(self):
+        if self.bot.error_webhook is not None:
+            self.notifier = ErrorNotifier(self.bot.error_webhook)
+            self.notifier.start()
+
+    async def cog_unload(self):
+        if self.notifier:
+            await self.notifier.close()
 
     @commands.Cog.listener("on_errorlog_create")
     async def handle_error_webhook(self, errorlog: ErrorLog):
-        if self.bot.error_webhook is None:
+        if self.notifier is None:
             return
 
-        try:
-            await self.bot.error_webhook.send(embed=errorlog.embed)
-        except discord.HTTPException as e:
+        self.notifier.push(errorlog)
+
+    @commands.command(name="notifierstats")
+    @commands.is_owner()
+    async def notifier_stats(self, ctx: NASAContext):
+        """Shows how many error notifications were sent, batched and dropped."""
+        if self.notifier is None:
+            await ctx.send("There is no error webhook configured.")
             return
 
+        await ctx.send(
+            f"Sent: {self.notifier.sent}\n"
+            f"Batched: {self.notifier.batched}\n"
+            f"Dropped: {self.notifier.dropped}\n"
+            f"Waiting: {self.notifier.waiting}"
+        )
+
     @commands.Cog.listener("on_interaction")
     async def delete_me(self, inter: discord.Interaction):
-        pprint(inter.data)
+        # Logged lazily, pprint-ing every interaction to stdout blocked the loop
+        log.debug("Interaction data: %s", inter.data)
 
     @commands.Cog.listener("on_disconnect")
     async def disconnected(self):
@@ -0,0 +1,405 @@
+import discord
+from discord.ext import commands
+
+import asyncio
+import io
+import math
+from logging import getLogger
+
+from aiohttp import web
+
+import utils
+from src.bot import NASABot, NASAContext
+
+log = getLogger("cogs.diagnostics")
+
+MEMORY_SAMPLES_FILE = "memory_samples.json"
+
+
+class Diagnostics(commands.Cog):
+    def __init__(self, bot: NASABot):
+        self.bot = bot
+        self._runner: web.AppRunner | None = None
+
+        metrics = bot.metrics
+        self.messages = metrics.counter(
+            "nasa_messages_processed_total", "Number of messages received"
+        )
+        self.loop_monitor = utils.LoopLagMonitor(
+            histogram=metrics.histogram(
+                "nasa_event_loop_lag_seconds",
+                "How late the event loop ran a scheduled callback",
+            ),
+            threshold=bot.config.loop_lag_threshold,
+        )
+        self.gateway_latency = metrics.gauge(
+            "nasa_gateway_latency_seconds", "Latency between a heartbeat and its ack"
+        )
+        self.cache_size = metrics.gauge(
+            "nasa_cache_size", "Number of objects held in a cache", ["cache"]
+        )
+        self.profiler = utils.CPUProfiler()
+        self.tracer = utils.MemoryTracer()
+        self.recorder: utils.GatewayRecorder | None = None
+        if bot.config.gateway_record_file:
+            self.recorder = utils.GatewayRecorder(bot.config.gateway_record_file)
+
+    async def cog_load(self):
+        self.gateway_latency.set_function(
+            lambda: self.bot.latency if math.isfinite(self.bot.latency) else 0
+        )
+        self.cache_size.set_function(lambda: len(self.bot.users), cache="users")
+        self.cache_size.set_function(lambda: len(self.bot.guilds), cache="guilds")
+        self.cache_size.set_function(
+            lambda: len(self.bot.cached_messages), cache="messages"
+        )
+        self.cache_size.set_function(self._voice_channels, cache="voice_channels")
+        self.cache_size.set_function(self._modmail_queues, cache="modmail_queues")
+
+        self.loop_monitor.start()
+        if self.recorder:
+            self.recorder.start()
+
+        if self.bot.config.metrics_port is not None:
+            # Each cluster serves its own metrics on the next port along
+            port = self.bot.config.metrics_port + self.bot.cluster_id
+            try:
+                await self.start_server(self.bot.config.metrics_host, port)
+            except OSError as e:
+                # Losing the endpoint shouldn't take the rest of the cog with it
+                log.error(f"Could not serve metrics on port {port}: {e}")
+                if self._runner:
+                    await self._runner.cleanup()
+                    self._runner = None
+
+    async def cog_unload(self):
+        self.loop_monitor.stop()
+        if self.tracer.tracing:
+            self.tracer.stop()
+        if self.recorder:
+            await self.recorder.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _voice_channels(self) -> int:
+        cog = self.bot.get_cog("Voices")
+        return len(cog.voice_handler.channel_cache) if cog else 0  # type: ignore
+
+    def _modmail_queues(self) -> int:
+        cog = self.bot.get_cog("ModMail")
+        return len(cog.queues) if cog else 0  # type: ignore
+
+    async def start_server(self, host: str, port: int):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        log.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.bot.metrics.render().encode("UTF-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    @commands.Cog.listener("on_message")
+    async def count_message(self, message: discord.Message):
+        self.messages.inc()
+
+    @commands.Cog.listener("on_socket_raw_receive")
+    async def record_gateway_event(self, payload: str):
+        if self.recorder:
+            self.recorder.record(payload)
+
+    @commands.command(name="looplag")
+    @commands.is_owner()
+    async def looplag(self, ctx: NASAContext):
+        """Shows event loop lag percentiles and the last blocking stack."""
+        content = f"Event loop lag: {self.loop_monitor.summary()}"
+        if self.loop_monitor.last_stall is None:
+            await ctx.send(content)
+            return
+
+        await ctx.send(
+            content,
+            file=discord.File(
+                io.BytesIO(self.loop_monitor.last_stall.encode("UTF-8")),
+                filename="last_stall.txt",
+            ),
+        )
+
+    @commands.command(name="slowest")
+    @commands.is_owner()
+    async def slowest(self, ctx: NASAContext, count: int = 10):
+        """Shows the listeners and commands with the highest p95 latency."""
+        stats = self.bot.timings.slowest(count)
+        if not stats:
+            await ctx.send("Nothing has been timed yet.")
+            return
+
+        lines = [f"{'Handler':<45} {'Calls':>7} {'p50':>8} {'p95':>8} {'Max':>8}"]
+        for s in stats:
+            name = f"{s.kind}:{s.handler}"[:45]
+            lines.append(
+                f"{name:<45} {s.count:>7} {s.p50 * 1000:>6.0f}ms {s.p95 * 1000:>6.0f}ms {s.max * 1000:>6.0f}ms"
+            )
+        await ctx.send("```\n" + "\n".join(lines)[:1980] + "\n```")
+
+    @commands.command(name="profile", aliases=["cpuprofile"])
+    @commands.is_owner()
+    async def profile(
+        self, ctx: NASAContext, seconds: float = 30.0, mode: str = "sample"
+    ):
+        """Profiles the event loop for a while and uploads the result.
+
+        ``sample`` gives collapsed stacks for a flame graph, ``cprofile`` a pstats file.
+        """
+        if mode not in self.profiler.MODES:
+            await ctx.send(f"Mode has to be one of {', '.join(self.profiler.MODES)}.")
+            return
+        if self.profiler.running:
+            await ctx.send("A profile is already running.")
+            return
+        seconds = min(max(seconds, 1.0), 300.0)
+
+        await ctx.send(f"Profiling for {seconds:.0f}s ({mode}).")
+        try:
+            result = await self.profiler.run(seconds, mode=mode)
+        except utils.ProfilerBusy:
+            await ctx.send("A profile is already running.")
+            return
+
+        await ctx.send(
+            "```\n" + result.summary()[:1980] + "\n```",
+            file=discord.File(io.BytesIO(result.data), filename=result.filename),
+        )
+
+    @commands.command(name="jobs")
+    @commands.is_owner()
+    async def jobs(self, ctx: NASAContext):
+        """Lists the scheduled jobs and when they run next."""
+        jobs = await self.bot.scheduler.jobs()
+        if not jobs:
+            await ctx.send("Nothing is scheduled.")
+            return
+
+        lines = []
+        for job in jobs[:25]:
+            every = f", every {job.interval}s" if job.interval else ""
+            handled = (
+                "" if job.name in self.bot.scheduler.handlers else " (no handler here)"
+            )
+            lines.append(
+                f"`{job.name}{':' + job.key if job.key else ''}` "
+                f"{discord.utils.format_dt(job.next_run, 'R')}{every}{handled}"
+            )
+        await ctx.send("\n".join(lines))
+
+    @commands.command(name="resolvers")
+    @commands.is_owner()
+    async def resolvers(self, ctx: NASAContext):
+        """Shows how user and channel lookups were answered."""
+        lines = [
+            f"{'Resolver':<10} {'Hits':>7} {'Misses':>7} {'Shared':>7} {'Missing':>8} {'Cached':>7}"
+        ]
+        for resolver in (self.bot.user_resolver, self.bot.channel_resolver):
+            s = resolver.stats()
+            lines.append(
+                f"{resolver.name:<10} {s.hits:>7} {s.misses:>7} {s.coalesced:>7} {s.negative:>8} {s.cached:>7}"
+            )
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+    @commands.command(name="cluster", aliases=["clusters"])
+    @commands.is_owner()
+    async def cluster(self, ctx: NASAContext, guild_id: int | None = None):
+        """Shows every cluster's shards and caches, or which shard holds a guild."""
+        if guild_id is not None:
+            try:
+                location = await self.bot.find_guild(guild_id)
+            except asyncio.TimeoutError:
+                await ctx.send("Not every cluster answered in time.")
+                return
+            if location is None:
+                await ctx.send(f"No cluster holds guild {guild_id}.")
+            else:
+                await ctx.send(
+                    f"Guild {guild_id} is on cluster {location[0]}, shard {location[1]}."
+                )
+            return
+
+        if self.bot.cluster is None:
+            stats = {self.bot.cluster_id: self.bot.cluster_stats()}
+        else:
+            try:
+                stats = await self.bot.cluster.request("stats")
+            except asyncio.TimeoutError:
+                await ctx.send("Not every cluster answered in time.")
+                return
+
+        lines = [
+            f"{'Cluster':<8} {'Shards':<12} {'Guilds':>7} {'Users':>8} {'Latency':>8} {'RSS':>9}"
+        ]
+        for cluster_id, s in sorted(stats.items()):
+            if "error" in s:
+                lines.append(f"{cluster_id:<8} {s['error']}")
+                continue
+            shards = ",".join(map(str, s["shards"])) or "-"
+            latency = (
+                f"{s['latency'] * 1000:.0f}ms" if s["latency"] is not None else "-"
+            )
+            lines.append(
+                f"{cluster_id:<8} {shards[:12]:<12} {s['guilds']:>7} {s['users']:>8} "
+                f"{latency:>8} {s['rss'] / 1024 / 1024:>7.1f}MB"
+            )
+        await ctx.send("```\n" + "\n".join(lines)[:1980] + "\n```")
+
+    # With invoke_without_command the group's checks don't run for its subcommands,
+    # so each of them needs its own is_owner
+    @commands.group(name="tracemalloc", aliases=["tm"], invoke_without_command=True)
+    @commands.is_owner()
+    async def tracemalloc(self, ctx: NASAContext):
+        """Shows whether tracemalloc is running and the snapshots taken so far."""
+        if not self.tracer.tracing:
+            await ctx.send(
+                f"tracemalloc isn't running, start it with `{ctx.prefix}tm start`."
+            )
+            return
+
+        current, peak = self.tracer.traced()
+        lines = [
+            f"Tracing {current / 1024 / 1024:.1f}MB (peak {peak / 1024 / 1024:.1f}MB)"
+        ]
+        for name, (taken, _) in self.tracer.snapshots.items():
+            lines.append(f"- `{name}` {discord.utils.format_dt(taken, 'R')}")
+        await ctx.send("\n".join(lines))
+
+    @tracemalloc.command(name="start")
+    @commands.is_owner()
+    async def tracemalloc_start(self, ctx: NASAContext):
+        """Starts tracing allocations, which slows the bot down a little."""
+        if self.tracer.tracing:
+            await ctx.send("tracemalloc is already running.")
+            return
+        self.tracer.start()
+        await ctx.send("Started tracemalloc.")
+
+    @tracemalloc.command(name="stop")
+    @commands.is_owner()
+    async def tracemalloc_stop(self, ctx: NASAContext):
+        """Stops tracing and drops the snapshots."""
+        self.tracer.stop()
+        await ctx.send("Stopped tracemalloc.")
+
+    @tracemalloc.command(name="snapshot", aliases=["snap"])
+    @commands.is_owner()
+    async def tracemalloc_snapshot(self, ctx: NASAContext, name: str):
+        """Takes a snapshot to diff against later."""
+        try:
+            await self.tracer.snapshot(name)
+        except RuntimeError as e:
+            await ctx.send(f"{e}.")
+            return
+        await ctx.send(
+            f"Took snapshot `{name}`, keeping the last {self.tracer.max_snapshots}."
+        )
+
+    @tracemalloc.command(name="diff")
+    @commands.is_owner()
+    async def tracemalloc_diff(
+        self, ctx: NASAContext, old: str, new: str | None = None, count: int = 10
+    ):
+        """Shows what grew between two snapshots, or between one and now."""
+        try:
+            diff = await self.tracer.diff(old, new)
+        except KeyError as e:
+            await ctx.send(f"There's no snapshot called `{e.args[0]}`.")
+            return
+        except RuntimeError as e:
+            await ctx.send(f"{e}.")
+            return
+
+        embed = discord.Embed(
+            title=f"Memory growth from {diff.old} to {diff.new}",
+            description=f"{diff.size_diff / 1024:+.1f} KiB in {diff.count_diff:+} blocks",
+            color=discord.Color.blue(),
+        )
+        for stat in diff.top(min(count, 25)):
+            embed.add_field(
+                name=diff.site(stat)[-256:],
+                value=f"{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+} blocks), "
+                f"{stat.size / 1024:.1f} KiB total",
+                inline=False,
+            )
+        report = await asyncio.to_thread(diff.format)
+        await ctx.send(
+            embed=embed,
+            file=discord.File(
+                io.BytesIO(report.encode("UTF-8")),
+                filename=f"tracemalloc-{diff.old}-{diff.new}.txt",
+            ),
+        )
+
+    @commands.command(name="memory", aliases=["mem"])
+    @commands.is_owner()
+    async def memory(self, ctx: NASAContext):
+        """Records memory use for the current gateway profile and compares it with the others."""
+        profile = self.bot.gateway_profile.name
+        samples = await asyncio.to_thread(
+            utils.record_memory_sample,
+            MEMORY_SAMPLES_FILE,
+            profile,
+            guilds=len(self.bot.guilds),
+            users=len(self.bot.users),
+            members=sum(len(g.members) for g in self.bot.guilds),
+            messages=len(self.bot.cached_messages),
+        )
+
+        lines = [
+            f"{'Profile':<10} {'RSS':>9} {'Guilds':>7} {'Users':>7} {'Members':>8} {'Messages':>9}"
+        ]
+        for name, sample in sorted(samples.items()):
+            marker = "*" if name == profile else " "
+            lines.append(
+                f"{marker}{name:<9} {sample['rss'] / 1024 / 1024:>7.1f}MB {sample['guilds']:>7} "
+                f"{sample['users']:>7} {sample['members']:>8} {sample['messages']:>9}"
+            )
+        await ctx.send(
+            f"{self.bot.gateway_profile.describe()}\n```\n" + "\n".join(lines) + "\n```"
+        )
+
+    @commands.command(name="jishaku", aliases=["loadjsk"])
+    @commands.is_owner()
+    async def load_jishaku(self, ctx: NASAContext):
+        """Loads jishaku, which is left out at startup to keep boot fast."""
+        if "jishaku" in self.bot.extensions:
+            await ctx.send("Jishaku is already loaded.")
+            return
+
+        await self.bot.load_extension("jishaku")
+        await ctx.send("Loaded jishaku.")
+
+    @commands.command(name="importtime")
+    @commands.is_owner()
+    async def importtime(self, ctx: NASAContext, count: int = 15):
+        """Measures how long the bot's modules take to import in a fresh interpreter."""
+        from utils.importtime import measure_imports
+
+        modules = ("utils", "src.bot", *self.bot.extensions)
+        async with ctx.typing():
+            try:
+                report = await asyncio.to_thread(
+                    measure_imports,
+                    modules,
+                    budget=self.bot.config.import_time_budget,
+                )
+            except Exception as e:
+                await ctx.send(f"Could not measure imports: {e}")
+                return
+
+        await ctx.send("```\n" + report.format(count)[-1980:] + "\n```")
+
+
+async def setup(bot: NASABot):
+    await bot.add_cog(Diagnostics(bot))
@@ -20,6 +20,9 @@ class ErrorHandler(commands.Cog):
         self._default_tree_error = self.bot.tree.on_error
         self.bot.tree.on_error = self.on_app_command_error
         self.session_errors = 0
+        self.error_counter = self.bot.metrics.counter(
+            "nasa_errors_total", "Number of errors handled", ["source"]
+        )
 
     async def cog_unload(self):
         self.bot.tree.on_error = self._default_tree_error
@@ -30,6 +33,7 @@ class ErrorHandler(commands.Cog):
         error: app_commands.AppCommandError,
     ):
         self.session_errors += 1
+        self.error_counter.inc(source="app_command")
         if isinstance(error, app_commands.CommandOnCooldown):
             if interaction.response.is_done():
                 return await interaction.followup.send(
@@ -95,6 +99,8 @@ class ErrorHandler(commands.Cog):
         if isinstance(error, ignored):
             return
 
+        self.error_counter.inc(source="command")
+
         if isinstance(error, commands.DisabledCommand):
             await ctx.send(f"{ctx.command} has been disabled.", ephemeral=True)
 
@@ -164,6 +170,8 @@ class ErrorHandler(commands.Cog):
                 ctx.bot.pool, traceback=trace, item=f"Command: {ctx.command.name}"  # type: ignore will always have a name
             )
 
+            self.bot.dispatch("errorlog_create", errorlog)
+
             _logger.error("Ignoring exception in command {}:".format(ctx.command))
             _logger.error(trace)
 
@@ -177,6 +185,8 @@ class ErrorHandler(commands.Cog):
 
     @commands.Cog.listener()
     async def on_level_error(self, channel: discord.abc.Messageable, error: str):
+        self.session_errors += 1
+        self.error_counter.inc(source="level")
         errorlog = await ErrorLog.create(
             self.bot.pool, traceback=error, item=f"XP Gain event"
         )
@@ -187,7 +197,7 @@ class ErrorHandler(commands.Cog):
     @commands.is_owner()
     async def totalerrors(self, ctx: NASAContext):
         await ctx.send(
-            f"There has been a total of {self.totalerrors} errors this session"
+            f"There has been a total of {self.session_errors} errors this session"
         )
 
 
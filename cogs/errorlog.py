@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import datetime
+import hashlib
 import io
 import logging
+import re
 from dataclasses import dataclass
 
 import asyncpg
@@ -10,9 +12,145 @@ import discord
 from discord.ext import commands
 
 from src.bot import NASABot, NASAContext
+import utils
 
 _logger = logging.getLogger("ErrorLogHandler")
 
+_FRAME_RE = re.compile(r'^\s*File "(?P<file>[^"]+)", line \d+, in (?P<func>.+)$')
+_EXCEPTION_RE = re.compile(r"^(?P<type>[A-Za-z_][\w.]*)(?::|$)")
+
+
+def fingerprint_traceback(traceback: str, item: str) -> str:
+    """Generates a stable fingerprint for a formatted traceback.
+
+    Only the exception types and the file/function of each frame are used, so
+    line numbers, messages, ids and memory addresses don't split up a group.
+
+    Parameters
+    ----------
+    traceback: str
+        The formatted traceback
+    item: str
+        The item/command the error happened in
+
+    Returns
+    -------
+    str
+        A hex digest identifying this kind of error
+    """
+    parts = [item]
+    for line in traceback.splitlines():
+        frame = _FRAME_RE.match(line)
+        if frame:
+            # Only keep the last two path components, install paths differ between machines
+            file = "/".join(re.split(r"[\\/]", frame["file"])[-2:])
+            parts.append(f"{file}:{frame['func']}")
+            continue
+        if line.startswith((" ", "Traceback", "During handling", "The above")):
+            continue
+        exc = _EXCEPTION_RE.match(line)
+        if exc:
+            parts.append(exc["type"])
+
+    return hashlib.sha1("\n".join(parts).encode("UTF-8")).hexdigest()[:16]
+
+
+class ErrorSearchFlags(commands.FlagConverter):
+    query: str | None = None
+    item: str | None = None
+    since: str | None = None
+    until: str | None = None
+    limit: commands.Range[int, 1, 50] = 20
+
+
+@dataclass
+class ErrorSummary:
+    """A lightweight view of an error, without the traceback"""
+
+    id: int
+    unixtimestamp: int
+    item: str
+    occurrences: int
+    last_seen: int | None
+
+    COLUMNS = "id, unixtimestamp, item, occurrences, last_seen"
+
+    @property
+    def timestamp(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(
+            self.unixtimestamp, tz=datetime.timezone.utc
+        )
+
+    @property
+    def last_seen_at(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(
+            self.last_seen or self.unixtimestamp, tz=datetime.timezone.utc
+        )
+
+    @property
+    def line(self) -> str:
+        return f"{self.id:0>5}: (Item: {self.item}) x{self.occurrences}, last seen {self.last_seen_at:%d-%m-%Y} at {self.last_seen_at:%I:%M:%M %p} UTC"
+
+    @classmethod
+    async def search(
+        cls,
+        pool: asyncpg.Pool,
+        *,
+        query: str | None = None,
+        item: str | None = None,
+        since: int | None = None,
+        until: int | None = None,
+        limit: int = 20,
+    ) -> list[ErrorSummary]:
+        """
+        |coro|
+
+        Searches the error log using the full text index over tracebacks and items
+
+        Parameters
+        ----------
+        pool: `asyncpg.Pool`
+            The client pool to use
+        query: `Optional[str]`
+            A web search style query (e.g. ``KeyError -modmail``)
+        item: `Optional[str]`
+            Only include errors whose item contains this text
+        since: `Optional[int]`
+            Only include errors last seen at or after this unix timestamp
+        until: `Optional[int]`
+            Only include errors last seen at or before this unix timestamp
+        limit: `int`
+            The maximum number of errors to return
+        """
+        conditions: list[str] = []
+        args: list = []
+
+        if query:
+            args.append(query)
+            conditions.append(f"search @@ websearch_to_tsquery('simple', ${len(args)})")
+        if item:
+            args.append(f"%{item}%")
+            conditions.append(f"item ILIKE ${len(args)}")
+        if since is not None:
+            args.append(since)
+            conditions.append(f"COALESCE(last_seen, unixtimestamp) >= ${len(args)}")
+        if until is not None:
+            args.append(until)
+            conditions.append(f"COALESCE(last_seen, unixtimestamp) <= ${len(args)}")
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if query:
+            order = "ts_rank(search, websearch_to_tsquery('simple', $1)) DESC, id DESC"
+        else:
+            order = "COALESCE(last_seen, unixtimestamp) DESC"
+
+        args.append(limit)
+        res = await pool.fetch(
+            f"SELECT {cls.COLUMNS} FROM errorlog {where} ORDER BY {order} LIMIT ${len(args)}",
+            *args,
+        )
+        return [cls(**r) for r in res]
+
 
 @dataclass
 class ErrorLog:
@@ -20,21 +158,39 @@ class ErrorLog:
     unixtimestamp: int
     traceback: str
     item: str
+    fingerprint: str | None
+    occurrences: int
+    last_seen: int | None
+
+    COLUMNS = "id, unixtimestamp, traceback, item, fingerprint, occurrences, last_seen"
 
     @classmethod
     async def get_or_none(cls, pool: asyncpg.Pool, id: int, /) -> ErrorLog | None:
-        res = await pool.fetchrow("SELECT * FROM errorlog WHERE id=$1", id)
+        res = await pool.fetchrow(f"SELECT {cls.COLUMNS} FROM errorlog WHERE id=$1", id)
 
         return cls(**res) if res is not None else None
 
     @classmethod
     async def create(cls, pool: asyncpg.Pool, *, traceback: str, item: str):
+        """
+        |coro|
+
+        Logs an error. If an error with the same fingerprint was already logged
+        its occurrence counter and last seen time are bumped instead.
+        """
         now_utc = int(discord.utils.utcnow().timestamp())
         res = await pool.fetchrow(
-            "INSERT INTO errorlog (unixtimestamp, traceback, item) VALUES ($1, $2, $3) RETURNING *",
+            f"""
+            INSERT INTO errorlog (unixtimestamp, traceback, item, fingerprint, last_seen)
+            VALUES ($1, $2, $3, $4, $1)
+            ON CONFLICT (fingerprint) DO UPDATE
+                SET occurrences = errorlog.occurrences + 1, last_seen = EXCLUDED.last_seen
+            RETURNING {cls.COLUMNS}
+            """,
             now_utc,
             traceback,
             item,
+            fingerprint_traceback(traceback, item),
         )
 
         return cls(**res)
@@ -48,12 +204,10 @@ class ErrorLog:
     @classmethod
     async def get_most_recent(
         cls, pool: asyncpg.Pool, num_to_get: int, /
-    ) -> list[ErrorLog] | None:
-        logs = await pool.fetch(
-            "SELECT * FROM errorlog ORDER BY id DESC LIMIT $1", num_to_get
-        )
+    ) -> list[ErrorSummary] | None:
+        logs = await ErrorSummary.search(pool, limit=num_to_get)
 
-        return [cls(**res) for res in logs] if logs else None
+        return logs or None
 
     @property
     def timestamp(self) -> datetime.datetime:
@@ -62,6 +216,18 @@ class ErrorLog:
             self.unixtimestamp, tz=datetime.timezone.utc
         )
 
+    @property
+    def last_seen_at(self) -> datetime.datetime:
+        """Returns a UTC datetime representing the latest occurrence"""
+        return datetime.datetime.fromtimestamp(
+            self.last_seen or self.unixtimestamp, tz=datetime.timezone.utc
+        )
+
+    @property
+    def is_new(self) -> bool:
+        """Whether this is the first time this error has been seen"""
+        return self.occurrences == 1
+
     @property
     def embed(self) -> discord.Embed:
         """Generates an embed that represents this error
@@ -79,6 +245,7 @@ class ErrorLog:
         embed.description = f"```{self.traceback[:5500]}```"
         embed.set_footer(
             text=f"Occurred On: {self.timestamp:%d:%m:%Y} at {self.timestamp:%I:%M:%M %p} UTC"
+            f" | Seen {self.occurrences} time{'s' if self.occurrences != 1 else ''}"
         )
 
         return embed
@@ -104,6 +271,7 @@ class ErrorLog:
         output = (
             f"Error #{self.id}{f' (Item/Command: {self.item})' if self.item is not None else ''}\n"
             f"Occurred On: {self.timestamp:%m-%d-%Y} at {self.timestamp:%I:%M:%M %p} UTC\n"
+            f"Occurrences: {self.occurrences} (last seen {self.last_seen_at:%m-%d-%Y} at {self.last_seen_at:%I:%M:%M %p} UTC)\n"
             f"{self.traceback}\n"
         )
         return output
@@ -148,16 +316,58 @@ class ErrorLogCog(commands.Cog):
     @commands.command(aliases=["re"])
     @commands.is_owner()
     async def recenterrors(self, ctx: NASAContext) -> None:
-        """Returns the 20 most recently logged errors."""
+        """Returns the 20 most recently seen errors, grouped by fingerprint."""
         errs = await ErrorLog.get_most_recent(ctx.bot.pool, 20)
         embed = discord.Embed(color=discord.Color.blue(), description="")
         if errs:
             for err in errs:
-                embed.description += f"{err.id:0>5}: (Item: {err.item}) {err.timestamp:%d-%m-%Y} at {err.timestamp:%I:%M:%M %p} UTC \n\n"  # type: ignore
+                embed.description += f"{err.line} \n\n"  # type: ignore
             await ctx.send(embed=embed)
         else:
             await ctx.send("No errors logged yet.")
 
+    @commands.command(aliases=["es"])
+    @commands.is_owner()
+    async def errorsearch(self, ctx: NASAContext, *, flags: ErrorSearchFlags) -> None:
+        """Searches logged errors.
+
+        Parameters
+        ----------
+        flags: ErrorSearchFlags
+            ``query:`` full text search over tracebacks and items,
+            ``item:`` filter by item, ``since:``/``until:`` relative times (2h, 7d) or dates,
+            ``limit:`` the number of results (max 50)
+        """
+        errs = await ErrorSummary.search(
+            ctx.bot.pool,
+            query=flags.query,
+            item=flags.item,
+            since=(
+                int(utils.parse_time(flags.since).timestamp()) if flags.since else None
+            ),
+            until=(
+                int(utils.parse_time(flags.until).timestamp()) if flags.until else None
+            ),
+            limit=flags.limit,
+        )
+        if not errs:
+            await ctx.send("No errors matched that search.")
+            return
+
+        description = ""
+        for i, err in enumerate(errs):
+            if len(description) + len(err.line) > 4000:
+                description += f"...and {len(errs) - i} more"
+                break
+            description += f"{err.line}\n"
+
+        embed = discord.Embed(
+            title=f"{len(errs)} matching error{'s' if len(errs) != 1 else ''}",
+            description=description,
+            color=discord.Color.blue(),
+        )
+        await ctx.send(embed=embed)
+
 
 async def setup(bot: NASABot):
     _logger.info("Loading cog ErrorLogCog")
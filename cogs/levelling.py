@@ -180,12 +180,8 @@ class Levelling(commands.Cog):
 
     @commands.Cog.listener("on_member_level_up")
     async def member_levelup(self, member: utils.NASAMember):
-        chnl: discord.abc.Messageable = self.bot.get_channel(self.bot.config.level_up_channel)  # type: ignore
-        if not chnl:
-            chnl = await self.bot.fetch_channel(self.bot.config.level_up_channel)  # type: ignore
-        user = self.bot.get_user(member.id)
-        if not user:
-            user = await self.bot.fetch_user(member.id)
+        chnl: discord.abc.Messageable = await self.bot.get_or_fetch_channel(self.bot.config.level_up_channel)  # type: ignore
+        user = await self.bot.get_or_fetch(member.id)
 
         await chnl.send(
             f"Congrats {user.mention}! You just advanced to level {member.level}"
@@ -1,34 +1,63 @@
 import discord
 from discord.ext import commands
 
+import asyncio
+import io
+import re
+
 from src import *
+import utils
+
+
+class TailFlags(commands.FlagConverter):
+    lines: commands.Range[int, 1, 5000] = 20
+    grep: str | None = None
+    since: str | None = None
 
 
 class LogCommands(commands.Cog):
     def __init__(self, bot: NASABot):
         self.bot = bot
 
-    @commands.command(name="logs")
-    async def logs(self, ctx: NASAContext):
-        with open(self.bot.error_log_file) as el:
-            d = el.readlines()
+    async def send_tail(self, ctx: NASAContext, path: str, flags: TailFlags):
+        try:
+            pattern = re.compile(flags.grep) if flags.grep else None
+        except re.error as e:
+            await ctx.reply(f"Invalid pattern: {e}")
+            return
+        since = None
+        if flags.since:
+            # Log records are stamped in naive local time
+            since = utils.parse_time(flags.since, tz=None).astimezone()
+            since = since.replace(tzinfo=None)
 
-        formatted = d[-20:]
+        lines = await asyncio.to_thread(
+            utils.tail_file, path, lines=flags.lines, pattern=pattern, since=since
+        )
+        string = "\n".join(lines)
 
-        string = "".join(formatted)
+        if not string:
+            await ctx.reply("No matching log lines.")
+        elif len(string) > 1900:
+            await ctx.reply(
+                file=discord.File(
+                    io.BytesIO(string.encode("UTF-8")), filename="logs.txt"
+                )
+            )
+        else:
+            await ctx.reply(f"```{discord.utils.escape_markdown(string)}```")
 
-        await ctx.reply(f"```{discord.utils.escape_markdown(string)}```")
+    @commands.command(name="logs")
+    @commands.is_owner()
+    async def logs(self, ctx: NASAContext, *, flags: TailFlags):
+        """Shows the end of the error log. Accepts lines:, grep: and since: flags."""
+        await self.send_tail(ctx, self.bot.error_log_file, flags)
 
     @commands.command(name="stdout")
-    async def stdout(self, ctx: NASAContext):
-        with open(self.bot.stdout_log_file) as sl:
-            d = sl.readlines()
-
-        formatted = d[-20:]
-
-        string = "".join(formatted)
-
-        await ctx.reply(f"```{discord.utils.escape_markdown(string)}```")
+    @commands.is_owner()
+    async def stdout(self, ctx: NASAContext, *, flags: TailFlags):
+        """Shows the end of the stdout log. Accepts lines:, grep: and since: flags."""
+        await self.send_tail(ctx, self.bot.stdout_log_file, flags)
 
 
 async def setup(bot: NASABot):
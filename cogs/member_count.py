@@ -0,0 +1,127 @@
+import discord
+from discord.ext import commands
+
+import asyncio
+import time
+from collections import deque
+from logging import getLogger
+from typing import Callable
+
+from src.bot import NASABot
+
+log = getLogger("cogs.member_count")
+
+
+class DebouncedRename:
+    """Renames a channel to the latest name it was given, within Discord's rename limit.
+
+    Discord only allows two renames of a channel every ten minutes. Names given
+    while a rename is waiting replace the one it will use, so a burst of joins costs
+    a single rename, and nothing is sent if the channel already has the name.
+    """
+
+    LIMIT = 2
+    PERIOD = 600.0
+
+    def __init__(
+        self,
+        get_channel: Callable[[], discord.abc.GuildChannel | None],
+        *,
+        delay: float = 15.0,
+    ):
+        self.get_channel = get_channel
+        self.delay = delay
+
+        self._name: str | None = None
+        self._renames: deque[float] = deque(maxlen=self.LIMIT)
+        self._task: asyncio.Task[None] | None = None
+
+    def update(self, name: str):
+        self._name = name
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.delay)
+            if len(self._renames) == self.LIMIT:
+                wait = self._renames[0] + self.PERIOD - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+            name = self._name
+            await self._rename(name)
+            # Go round again if the name changed while renaming
+            if self._name == name:
+                return
+
+    async def _rename(self, name: str | None):
+        channel = self.get_channel()
+        if channel is None or name is None or channel.name == name:
+            return
+
+        self._renames.append(time.monotonic())
+        try:
+            await channel.edit(name=name)
+        except discord.HTTPException:
+            log.exception(f"Failed to rename {channel} to {name}")
+
+
+class MemberCount(commands.Cog):
+    """Keeps the member count channel up to date as members join and leave.
+
+    Every cluster loads this, but only the one holding the guild receives its member
+    events and renames the channel.
+    """
+
+    def __init__(self, bot: NASABot):
+        self.bot = bot
+        self.renamer = DebouncedRename(self.channel)
+
+    async def cog_unload(self):
+        self.renamer.cancel()
+
+    def channel(self) -> discord.abc.GuildChannel | None:
+        channel = self.bot.get_channel(self.bot.config.member_channel)
+        return channel if isinstance(channel, discord.abc.GuildChannel) else None
+
+    @property
+    def guild_id(self) -> int | None:
+        if self.bot.config.member_count_guild is not None:
+            return self.bot.config.member_count_guild
+        # Default to counting the guild the channel is in
+        channel = self.channel()
+        return channel.guild.id if channel else None
+
+    def update(self, guild: discord.Guild):
+        if guild.id != self.guild_id or guild.member_count is None:
+            return
+        self.renamer.update(f"Discord Members: {guild.member_count}")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Catch up with anything missed while disconnected
+        guild_id = self.guild_id
+        guild = self.bot.get_guild(guild_id) if guild_id else None
+        if guild:
+            self.update(guild)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.update(member.guild)
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        # on_member_remove is only dispatched for cached members, which the lean
+        # profile mostly doesn't have
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild:
+            self.update(guild)
+
+
+async def setup(bot: NASABot):
+    await bot.add_cog(MemberCount(bot))
@@ -1,7 +1,6 @@
 import datetime
 import os
 import asyncpg
-from humanreadable import Time  # type: ignore
 import discord
 from discord import app_commands
 from discord.ext import commands
@@ -12,6 +11,8 @@ import re
 from src.bot import NASABot, NASAInteraction
 import utils
 
+humanreadable = utils.lazy_import("humanreadable")
+
 
 class Moderation(commands.Cog):
     def __init__(self: Self, bot: NASABot):
@@ -78,7 +79,7 @@ class Moderation(commands.Cog):
 
         reason += f" | {interaction.user} (ID: {interaction.user.id})"
 
-        seconds = Time(duration).seconds
+        seconds = humanreadable.Time(duration).seconds
 
         timeout_until = datetime.timedelta(seconds=seconds)
         await user.timeout(timeout_until, reason=reason)
@@ -273,7 +274,7 @@ class Moderation(commands.Cog):
                 )
 
             elif view.value:
-                self.bot.config._update_value("mailmod_forum_id", channel.id)
+                self.bot.config._update_value("modmail_forum_id", channel.id)
                 await interaction.response.edit_message(
                     content="You have updated the `MailMod Forum ID`!", view=None
                 )
@@ -282,7 +283,7 @@ class Moderation(commands.Cog):
                     content="The `MailMod Forum ID` had not been updated!", view=None
                 )
 
-        self.bot.config._update_value("mailmod_forum_id", channel.id)
+        self.bot.config._update_value("modmail_forum_id", channel.id)
         await interaction.response.send_message("You have set the `MailMod Forum ID`!")
 
 
@@ -3,32 +3,63 @@ from discord import app_commands
 from discord.ext import commands
 
 import asyncio
-from typing import Optional
+import gzip
+import heapq
+import html
+import itertools
+import json
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
 from logging import getLogger
 
-from src.bot import NASABot
+import utils
+from src.bot import NASABot, NASAContext
 from .errorlog import ErrorLog
 
 log = getLogger("cogs.modmail")
 
+_delivery_seconds = utils.default_registry.histogram(
+    "nasa_modmail_delivery_seconds",
+    "Time from a modmail message being queued to being delivered",
+)
+
 
 class Webhook:
     def __init__(self, webhook: discord.Webhook) -> None:
         self.webhook = webhook
-        self.send_lock = asyncio.Lock()
-        self.channel_ids: list[int] = []
-
-    async def send(self, *, message: discord.Message, thread: discord.Thread):
-        async with self.send_lock:
-            files = [
-                await a.to_file()
-                for a in message.attachments
-                if a.size < thread.guild.filesize_limit
-            ]
+        self.channel_ids: set[int] = set()
+        self._sends: deque[float] = deque()
+        # Bumped whenever the load changes, stale heap entries are skipped
+        self._version: int = 0
+
+    @property
+    def load(self) -> int:
+        return len(self.channel_ids)
+
+    def send_rate(self, window: float) -> float:
+        """Returns the number of sends per second over the last ``window`` seconds"""
+        cutoff = time.monotonic() - window
+        while self._sends and self._sends[0] < cutoff:
+            self._sends.popleft()
+        return len(self._sends) / window
+
+    async def send(
+        self,
+        *,
+        message: discord.Message,
+        thread: discord.Thread,
+        relay: utils.AttachmentRelay,
+    ):
+        self._sends.append(time.monotonic())
+        async with await relay.relay(
+            message.attachments, limit=thread.guild.filesize_limit
+        ) as relayed:
             try:
                 await self.webhook.send(
                     content=message.content,
-                    files=files,
+                    files=relayed.files,
                     username=message.author.name,
                     avatar_url=message.author.display_avatar.url,
                     thread=thread,
@@ -44,35 +75,310 @@ class Webhook:
                 )
                 log.error("Could not send message", exc_info=e)
             else:
-                if len(files) != len(message.attachments):
+                if len(relayed.files) != relayed.total:
                     await message.author.send(
-                        f"Failed to send {len(message.attachments) - len(files)}/{len(message.attachments)} files."
+                        f"Failed to send {relayed.total - len(relayed.files)}/{relayed.total} files."
                     )
 
 
 class WebhookManager:
-    def __init__(self, webhooks: list[discord.Webhook]):
-        self.webhooks = [Webhook(w) for w in webhooks]
-        self._get_lock = asyncio.Lock()
+    # Discord allows at most 15 webhooks per channel
+    MAX_WEBHOOKS = 15
+    RATE_WINDOW = 60.0
 
-    async def get_webhook(self, channel_id: int) -> Webhook:
-        async with self._get_lock:
-            webhook_list = [w for w in self.webhooks if channel_id in w.channel_ids]
-            if not webhook_list:
-                kps = {len(w.channel_ids): w for w in self.webhooks}
-                webhook = kps[min(kps.keys())]
-                webhook.channel_ids.append(channel_id)
+    def __init__(
+        self,
+        forum: discord.ForumChannel,
+        webhooks: list[discord.Webhook],
+        *,
+        rate_threshold: float,
+    ):
+        self.forum = forum
+        self.rate_threshold = rate_threshold
+        self.webhooks: list[Webhook] = []
+        self._assignments: dict[int, Webhook] = {}
+        self._heap: list[tuple[int, int, int, Webhook]] = []
+        self._counter = itertools.count()
+        self._provision_lock = asyncio.Lock()
+
+        for w in webhooks:
+            self._add(Webhook(w))
+
+    def _add(self, webhook: Webhook):
+        self.webhooks.append(webhook)
+        self._push(webhook)
+
+    def _push(self, webhook: Webhook):
+        webhook._version += 1
+        heapq.heappush(
+            self._heap,
+            (webhook.load, next(self._counter), webhook._version, webhook),
+        )
+
+    def _least_loaded(self) -> Webhook | None:
+        while self._heap:
+            _, _, version, webhook = self._heap[0]
+            if version == webhook._version:
                 return webhook
-            return webhook_list[0]
+            heapq.heappop(self._heap)
+        return None
+
+    def _assign(self, channel_id: int, webhook: Webhook) -> Webhook:
+        webhook.channel_ids.add(channel_id)
+        self._assignments[channel_id] = webhook
+        self._push(webhook)
+        return webhook
+
+    def release(self, channel_id: int):
+        """Removes the assignment of a thread, freeing up capacity on its webhook"""
+        webhook = self._assignments.pop(channel_id, None)
+        if webhook is not None:
+            webhook.channel_ids.discard(channel_id)
+            self._push(webhook)
+
+    def _needs_provisioning(self, webhook: Webhook | None) -> bool:
+        if webhook is None:
+            return True
+        if len(self.webhooks) >= self.MAX_WEBHOOKS:
+            return False
+        return webhook.send_rate(self.RATE_WINDOW) > self.rate_threshold
+
+    async def _provision(self) -> Webhook:
+        created = await self.forum.create_webhook(
+            name=f"Modmail {len(self.webhooks) + 1}"
+        )
+        webhook = Webhook(created)
+        self._add(webhook)
+        log.info(
+            "Provisioned modmail webhook %s (%s total)", created.id, len(self.webhooks)
+        )
+        return webhook
+
+    async def get_webhook(self, channel_id: int) -> Webhook:
+        webhook = self._assignments.get(channel_id)
+        if webhook is not None:
+            return webhook
+
+        candidate = self._least_loaded()
+        if self._needs_provisioning(candidate):
+            async with self._provision_lock:
+                # Another thread may have been assigned or provisioned while waiting
+                webhook = self._assignments.get(channel_id)
+                if webhook is not None:
+                    return webhook
+                candidate = self._least_loaded()
+                if self._needs_provisioning(candidate):
+                    try:
+                        candidate = await self._provision()
+                    except discord.HTTPException as e:
+                        if candidate is None:
+                            raise
+                        log.warning("Could not provision modmail webhook", exc_info=e)
+
+        return self._assign(channel_id, candidate)  # type: ignore  candidate is only None if provisioning raised
+
+
+class ThreadQueues:
+    """Per-thread FIFO delivery queues.
+
+    Deliveries for the same thread run one after another in the order they were
+    queued, while different threads are delivered in parallel. Each thread gets a
+    worker task which exits once its queue has been idle for ``idle_timeout``.
+    """
+
+    def __init__(self, *, maxsize: int = 50, idle_timeout: float = 60.0):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._queues: dict[
+            int, asyncio.Queue[tuple[float, Callable[[], Awaitable[None]]]]
+        ] = {}
+        self._workers: dict[int, asyncio.Task[None]] = {}
+        # Enqueue -> delivered latency of the most recent deliveries, in seconds
+        self.latencies: deque[float] = deque(maxlen=1000)
+
+    def __len__(self) -> int:
+        return len(self._queues)
+
+    @property
+    def pending(self) -> int:
+        return sum(q.qsize() for q in self._queues.values())
+
+    async def put(self, thread_id: int, job: Callable[[], Awaitable[None]]):
+        """
+        |coro|
+
+        Queues a delivery for a thread, waiting if that thread's queue is full.
+        """
+        queue = self._queues.get(thread_id)
+        if queue is None:
+            queue = self._queues[thread_id] = asyncio.Queue(self.maxsize)
+            self._workers[thread_id] = asyncio.create_task(
+                self._worker(thread_id, queue), name=f"modmail-queue-{thread_id}"
+            )
+        await queue.put((time.perf_counter(), job))
+
+    async def _worker(
+        self,
+        thread_id: int,
+        queue: asyncio.Queue[tuple[float, Callable[[], Awaitable[None]]]],
+    ):
+        while True:
+            try:
+                enqueued_at, job = await asyncio.wait_for(
+                    queue.get(), timeout=self.idle_timeout
+                )
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self._queues[thread_id]
+                    del self._workers[thread_id]
+                    return
+                continue
+
+            try:
+                await job()
+            except Exception as e:
+                log.error(f"Modmail delivery failed for thread {thread_id}", exc_info=e)
+            finally:
+                latency = time.perf_counter() - enqueued_at
+                self.latencies.append(latency)
+                _delivery_seconds.observe(latency)
+                queue.task_done()
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def close(self):
+        for task in self._workers.values():
+            task.cancel()
+        self._workers.clear()
+        self._queues.clear()
+
+
+class TranscriptWriter:
+    """Streams a thread's history into a gzip compressed JSONL file, then renders
+    a gzip compressed HTML copy of it for reading in a browser.
+
+    Messages are fetched and written one page at a time, and the HTML is rendered
+    from the JSONL a line at a time, so memory use does not depend on the length
+    of the conversation.
+    """
+
+    PAGE_SIZE = 100
+
+    def __init__(self, thread: discord.Thread, path: str):
+        self.thread = thread
+        self.path = path
+        self.message_count = 0
+
+    @staticmethod
+    def html_path(path: str) -> str:
+        return path.removesuffix(".jsonl.gz") + ".html.gz"
+
+    @staticmethod
+    def serialize(message: discord.Message) -> dict:
+        return {
+            "id": message.id,
+            "author_id": message.author.id,
+            "author": str(message.author),
+            "webhook_id": message.webhook_id,
+            "created_at": message.created_at.isoformat(),
+            "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+            "content": message.content,
+            "attachments": [a.url for a in message.attachments],
+            "embeds": [e.to_dict() for e in message.embeds],
+        }
+
+    async def write(self) -> int:
+        tmp_path = f"{self.path}.part"
+        fp = await asyncio.to_thread(gzip.open, tmp_path, "wt", encoding="utf-8")
+        try:
+            page: list[str] = []
+            async for message in self.thread.history(limit=None, oldest_first=True):
+                page.append(json.dumps(self.serialize(message)))
+                if len(page) >= self.PAGE_SIZE:
+                    await self._flush(fp, page)
+            await self._flush(fp, page)
+        except BaseException:
+            await asyncio.to_thread(fp.close)
+            await asyncio.to_thread(os.remove, tmp_path)
+            raise
+
+        await asyncio.to_thread(fp.close)
+        await asyncio.to_thread(os.replace, tmp_path, self.path)
+        await asyncio.to_thread(self.render_html)
+        return self.message_count
+
+    @staticmethod
+    def _render_message(message: dict) -> str:
+        parts = [
+            f'<div class="message"><span class="author">{html.escape(message["author"])}</span> '
+            f'<time>{html.escape(message["created_at"])}</time>'
+        ]
+        if message["content"]:
+            parts.append(f'<p>{html.escape(message["content"])}</p>')
+        for url in message["attachments"]:
+            url = html.escape(url)
+            parts.append(f'<p><a href="{url}">{url}</a></p>')
+        for embed in message["embeds"]:
+            text = " - ".join(
+                embed[key] for key in ("title", "description") if embed.get(key)
+            )
+            if text:
+                parts.append(f"<blockquote>{html.escape(text)}</blockquote>")
+        parts.append("</div>")
+        return "".join(parts) + "\n"
+
+    def render_html(self):
+        """Renders the JSONL transcript as HTML. This blocks, run it in a thread."""
+        path = self.html_path(self.path)
+        tmp_path = f"{path}.part"
+        title = html.escape(f"Modmail transcript: {self.thread.name}")
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as source, gzip.open(
+                tmp_path, "wt", encoding="utf-8"
+            ) as out:
+                out.write(
+                    f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title>'
+                    "<style>body{font-family:sans-serif}.message{margin:0.5em 0}"
+                    ".author{font-weight:bold}time{color:#888;font-size:0.8em}</style>"
+                    f"</head><body><h1>{title}</h1>\n"
+                )
+                for line in source:
+                    out.write(self._render_message(json.loads(line)))
+                out.write("</body></html>\n")
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+
+    async def _flush(self, fp, page: list[str]):
+        if not page:
+            return
+        data = "\n".join(page) + "\n"
+        self.message_count += len(page)
+        page.clear()
+        await asyncio.to_thread(fp.write, data)
 
 
 class ModMail(commands.Cog):
     def __init__(self, bot: NASABot):
         self.bot = bot
         self.manager: WebhookManager | None = None
+        self._manager_lock = asyncio.Lock()
+        self.relay = utils.AttachmentRelay(bot.session)
         self.concurrency = commands.MaxConcurrency(
             1, per=commands.BucketType.user, wait=True
         )
+        self.queues = ThreadQueues()
+        self._archive_semaphore = asyncio.Semaphore(4)
+        self._archiving: set[int] = set()
+
+    async def cog_unload(self):
+        self.queues.close()
 
     @property
     def forum(self) -> discord.ForumChannel:
@@ -83,9 +389,17 @@ class ModMail(commands.Cog):
 
     async def get_manager(self) -> WebhookManager:
         await self.bot.wait_until_ready()
-        if not self.manager:
-            webhooks = await self.forum.webhooks()
-            self.manager = WebhookManager(webhooks)
+        # Without the lock every DM that arrives before the first one is done would
+        # make its own manager, and the later ones would replace the first
+        async with self._manager_lock:
+            if not self.manager:
+                forum = self.forum
+                webhooks = await forum.webhooks()
+                self.manager = WebhookManager(
+                    forum,
+                    [w for w in webhooks if w.type is discord.WebhookType.incoming],
+                    rate_threshold=self.bot.config.modmail_webhook_rate,
+                )
         return self.manager
 
     @commands.Cog.listener("on_message")
@@ -98,7 +412,17 @@ class ModMail(commands.Cog):
         if not isinstance(message.channel, discord.Thread):
             return
         if message.channel.parent == self.forum:
-            await self.process_reply(message)
+            # Most replies aren't commands, so skip building a context for them
+            prefix = await self.bot.get_prefix(message)
+            if isinstance(prefix, list):
+                prefix = tuple(prefix)
+            if message.content.startswith(prefix):
+                ctx = await self.bot.get_context(message)
+                if ctx.valid:
+                    return
+            await self.queues.put(
+                message.channel.id, lambda: self.process_reply(message)
+            )
 
     async def make_thread(self, message: discord.Message) -> discord.Thread:
         thread, _ = await self.forum.create_thread(
@@ -135,6 +459,8 @@ class ModMail(commands.Cog):
         return embed
 
     async def process_dm(self, message: discord.Message):
+        # The per-user lock only covers finding the thread and queueing the
+        # message, delivery itself happens on the thread's queue
         try:
             await self.concurrency.acquire(message)
             thread_id: Optional[int] = await self.bot.pool.fetchval(
@@ -154,7 +480,10 @@ class ModMail(commands.Cog):
                         thread = await self.make_thread(message)
             manager = await self.get_manager()
             webhook = await manager.get_webhook(thread.id)
-            await webhook.send(message=message, thread=thread)
+            await self.queues.put(
+                thread.id,
+                lambda: webhook.send(message=message, thread=thread, relay=self.relay),
+            )
         finally:
             await self.concurrency.release(message)
 
@@ -165,24 +494,132 @@ class ModMail(commands.Cog):
 
         if not user_id:
             return
-        user = await self.bot.get_or_fetch(user_id)
         try:
-            if not user:
-                user = await self.bot.fetch_user(user_id)
-
-            files = [
-                await a.to_file()
-                for a in message.attachments
-                if a.size < self.forum.guild.filesize_limit
-            ]
-            await user.send(
-                content=f"**{discord.utils.escape_markdown(str(message.author))}:** {message.content}",
-                files=files,
-            )
+            user = await self.bot.get_or_fetch(user_id)
+
+            async with await self.relay.relay(
+                message.attachments, limit=self.forum.guild.filesize_limit
+            ) as relayed:
+                await user.send(
+                    content=f"**{discord.utils.escape_markdown(str(message.author))}:** {message.content}",
+                    files=relayed.files,
+                )
+            if len(relayed.files) != relayed.total:
+                await message.channel.send(
+                    f"Failed to send {relayed.total - len(relayed.files)}/{relayed.total} files.",
+                    delete_after=15,
+                )
         except discord.HTTPException as e:
             await message.add_reaction("⚠")
             await message.channel.send(f"{e.__class__.__name__}: {e}", delete_after=15)
 
+    async def archive_thread(
+        self, thread: discord.Thread, *, closed_by: int
+    ) -> tuple[str, int]:
+        """
+        |coro|
+
+        Archives a modmail thread into a compressed transcript.
+        Several threads can be archived in parallel.
+
+        Parameters
+        ----------
+        thread: `discord.Thread`
+            The modmail thread to archive
+        closed_by: `int`
+            The id of the moderator closing the thread
+
+        Returns
+        -------
+        `tuple[str, int]`
+            The path of the transcript and the number of messages in it
+        """
+        if thread.id in self._archiving:
+            raise RuntimeError("This thread is already being archived")
+
+        self._archiving.add(thread.id)
+        try:
+            async with self._archive_semaphore:
+                directory = self.bot.config.transcript_dir
+                await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+                now = int(discord.utils.utcnow().timestamp())
+                path = os.path.join(directory, f"{thread.id}-{now}.jsonl.gz")
+
+                writer = TranscriptWriter(thread, path)
+                count = await writer.write()
+
+                # The thread is only forgotten if its transcript is recorded
+                async with self.bot.pool.acquire() as conn, conn.transaction():
+                    user_id: Optional[int] = await conn.fetchval(
+                        "DELETE FROM modmail WHERE thread_id = $1 RETURNING user_id",
+                        thread.id,
+                    )
+                    await conn.execute(
+                        "INSERT INTO modmail_transcripts (thread_id, user_id, path, message_count, closed_by, created_at) VALUES ($1, $2, $3, $4, $5, $6)",
+                        thread.id,
+                        user_id,
+                        path,
+                        count,
+                        closed_by,
+                        now,
+                    )
+        finally:
+            self._archiving.discard(thread.id)
+
+        if self.manager:
+            self.manager.release(thread.id)
+
+        log.info(f"Archived modmail thread {thread.id} ({count} messages) to {path}")
+        return path, count
+
+    @commands.command(name="close")
+    @commands.has_permissions(manage_threads=True)
+    async def close_thread(self, ctx: NASAContext):
+        """Archives this modmail thread into a transcript and closes it."""
+        thread = ctx.channel
+        if (
+            not isinstance(thread, discord.Thread)
+            or thread.parent_id != self.bot.config.modmail_forum_id
+        ):
+            await ctx.send("This command can only be used in a modmail thread.")
+            return
+
+        try:
+            async with ctx.typing():
+                path, count = await self.archive_thread(thread, closed_by=ctx.author.id)
+        except RuntimeError as e:
+            await ctx.send(str(e))
+            return
+
+        await ctx.send(
+            f"Saved a transcript of {count} messages to `{path}` "
+            f"(readable copy at `{TranscriptWriter.html_path(path)}`). Closing this thread."
+        )
+        await thread.edit(archived=True, locked=True)
+
+    @commands.command(name="mailstats")
+    @commands.is_owner()
+    async def mail_stats(self, ctx: NASAContext):
+        """Shows the state of the modmail delivery queues."""
+        await ctx.send(
+            f"Active queues: {len(self.queues)}\n"
+            f"Pending deliveries: {self.queues.pending}\n"
+            f"Delivery latency: p50 {self.queues.percentile(0.5) * 1000:.0f}ms, "
+            f"p95 {self.queues.percentile(0.95) * 1000:.0f}ms"
+        )
+
+    @commands.Cog.listener("on_ready")
+    async def chunk_modmail_guild(self):
+        # on_user_update only fires for cached members. The lean profile doesn't
+        # chunk at startup, so the modmail guild is chunked here to keep renames
+        # working
+        try:
+            guild = self.forum.guild
+        except RuntimeError:
+            return
+        if not guild.chunked:
+            await guild.chunk()
+
     @commands.Cog.listener("on_user_update")
     async def mail_user_update(self, before: discord.User, after: discord.User):
         if str(before) == str(after):
@@ -1,12 +1,15 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
-from bs4 import BeautifulSoup
 from logging import getLogger
 
 import src
+import utils
 
 _poll_rate: int = 15  # Number of minutes for each update task
+_max_backoff: int = 6 * 60  # Most minutes between tiktok polls while they keep failing
+
+TIKTOK_JOB = "tiktok_followers"
 
 logger = getLogger("NASA.scheduledtasks")
 
@@ -14,58 +17,60 @@ logger = getLogger("NASA.scheduledtasks")
 class ScheduledTasks(commands.Cog):
     def __init__(self, bot: src.NASABot):
         self.bot = bot
+        self.tiktok = utils.TikTokPoller(bot.session, bot.config.tiktok_username)
 
     async def cog_load(self):
-        self.update_member_count.start()
-        self.update_tiktok_followers.start()
-
-    @tasks.loop(minutes=_poll_rate)
-    async def update_tiktok_followers(self):
-        logger.info("Updating tiktok followers")
-        headers = {
-            "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86-64; rv:90.0) Gecko/20100101 Firefox/90.0"
-        }
-
-        response = await self.bot.session.get(
-            "https://tiktok.com/@jayd3nn.x", headers=headers
+        # A poll missed while the bot was down runs once as soon as it's back
+        self.bot.scheduler.register(
+            TIKTOK_JOB, self.update_tiktok_followers, catch_up="run_once", jitter=30
         )
+        await self.bot.scheduler.every(TIKTOK_JOB, _poll_rate * 60)
 
-        txt_res = await response.read()
-
-        soup = BeautifulSoup(txt_res, "html.parser")
+    async def cog_unload(self):
+        self.bot.scheduler.unregister(TIKTOK_JOB)
 
+    async def update_tiktok_followers(self, job: utils.Job):
+        await self.bot.wait_until_ready()
+        logger.info("Updating tiktok followers")
+        # The username can be changed in the config while the bot runs
+        if self.tiktok.username != self.bot.config.tiktok_username:
+            self.tiktok = utils.TikTokPoller(
+                self.bot.session, self.bot.config.tiktok_username
+            )
         try:
-            follower_count = soup.select_one('[title="Followers"]').text
-
-            await self.bot.tiktok_channel.edit(
-                name=f"Tiktok Followers: {follower_count}"
+            follower_count = await self.tiktok.poll()
+        except utils.TikTokError as e:
+            await self.tiktok_failed(e, job.payload.get("failures", 0) + 1)
+            return
+
+        if job.payload.get("failures"):
+            # Clear the failure count, every() leaves the next run where it is
+            await self.bot.scheduler.every(
+                TIKTOK_JOB, _poll_rate * 60, replace_payload=True
             )
 
-        except AttributeError:
+        # Channel renames are heavily rate limited, so don't waste one
+        name = f"Tiktok Followers: {follower_count}"
+        if self.bot.tiktok_channel.name != name:
+            await self.bot.tiktok_channel.edit(name=name)
+
+    async def tiktok_failed(self, error: utils.TikTokError, failures: int):
+        backoff = min(_poll_rate * 2**failures, _max_backoff)
+        # The failure count is kept with the job so the backoff survives a restart
+        await self.bot.scheduler.schedule(
+            TIKTOK_JOB,
+            delay=backoff * 60,
+            interval=_poll_rate * 60,
+            payload={"failures": failures},
+        )
+        logger.warning(f"{error}, trying again in {backoff} minutes")
+
+        # Only ping once for each run of failures
+        if failures == 1 and self.bot.error_webhook:
             await self.bot.error_webhook.send(
-                f"<@{self.bot.owner_id}> Tiktok Followers failed."
+                f"<@{self.bot.owner_id}> Tiktok Followers failed: {error}"
             )
 
-    @update_tiktok_followers.before_loop
-    async def before_tiktok(self):
-        await self.bot.wait_until_ready()
-
-    @tasks.loop(minutes=_poll_rate)
-    async def update_member_count(self):
-        logger.info("Updating member count")
-        # Get member count from guild
-        guild = self.bot.get_guild(1064589769671192668)
-        if not guild:
-            guild = await self.bot.fetch_guild(1064589769671192668)
-
-        total = guild.member_count
-
-        await self.bot.member_channel.edit(name=f"Discord Members: {total}")
-
-    @update_member_count.before_loop
-    async def before_tiktok(self):
-        await self.bot.wait_until_ready()
-
 
 async def setup(bot: src.NASABot):
     await bot.add_cog(ScheduledTasks(bot))
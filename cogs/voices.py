@@ -128,10 +128,6 @@ class Voices(commands.Cog):
                 voicestate.owner_in = False
                 self.voice_handler.update_handler(voicestate)
 
-            member = self.bot.get_user(voicestate.owner)
-            if not member:
-                member = self.bot.fetch_user(voicestate.owner)
-
     @app_commands.command(name="create-voice")
     @app_commands.default_permissions(administrator=True)
     async def create_join_vc_channel(
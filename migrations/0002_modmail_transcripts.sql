@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS modmail_transcripts (
+    id SERIAL PRIMARY KEY,
+    thread_id BIGINT NOT NULL,
+    user_id BIGINT,
+    path TEXT NOT NULL,
+    message_count INT NOT NULL,
+    closed_by BIGINT NOT NULL,
+    created_at BIGINT NOT NULL
+);
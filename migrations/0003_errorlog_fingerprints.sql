@@ -0,0 +1,4 @@
+ALTER TABLE errorlog ADD COLUMN IF NOT EXISTS fingerprint TEXT;
+ALTER TABLE errorlog ADD COLUMN IF NOT EXISTS occurrences INT NOT NULL DEFAULT 1;
+ALTER TABLE errorlog ADD COLUMN IF NOT EXISTS last_seen BIGINT;
+CREATE UNIQUE INDEX IF NOT EXISTS errorlog_fingerprint_idx ON errorlog (fingerprint);
@@ -0,0 +1,4 @@
+ALTER TABLE errorlog ADD COLUMN IF NOT EXISTS search tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', item || ' ' || traceback)) STORED;
+CREATE INDEX IF NOT EXISTS errorlog_search_idx ON errorlog USING GIN (search);
+CREATE INDEX IF NOT EXISTS errorlog_last_seen_idx ON errorlog ((COALESCE(last_seen, unixtimestamp)) DESC);
@@ -0,0 +1,13 @@
+-- Indexes for the lookups the bot makes on every command or event,
+-- bench/queries.py fails if any of these queries falls back to a seq scan
+
+CREATE INDEX IF NOT EXISTS moderationlog_moderatee_idx ON moderationlog (moderatee_id, unixtimestamp DESC);
+CREATE INDEX IF NOT EXISTS moderationlog_moderator_idx ON moderationlog (moderator_id, unixtimestamp DESC);
+
+CREATE INDEX IF NOT EXISTS warnings_user_id_idx ON warnings (user_id);
+
+CREATE INDEX IF NOT EXISTS modmail_thread_id_idx ON modmail (thread_id);
+
+-- Only active mutes are ever looked up, which is a small slice of the table
+CREATE INDEX IF NOT EXISTS muted_active_expires_idx ON muted (expires) WHERE NOT expired;
+CREATE INDEX IF NOT EXISTS muted_active_id_idx ON muted (id) WHERE NOT expired;
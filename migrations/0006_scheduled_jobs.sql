@@ -0,0 +1,16 @@
+-- Jobs run by utils.scheduler.Scheduler. Times are unix timestamps like the rest of the schema.
+-- A row is claimed with FOR UPDATE SKIP LOCKED and moved on (or deleted) before its job runs,
+-- so a run happens at most once however many processes are polling.
+
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    name TEXT NOT NULL,               -- The handler registered with the scheduler
+    key TEXT NOT NULL DEFAULT '',     -- Tells jobs with the same handler apart, e.g. an lfg id
+    payload JSONB NOT NULL DEFAULT '{}',
+    run_at BIGINT NOT NULL,
+    interval_seconds INT,             -- NULL for jobs that only run once
+    last_run_at BIGINT,
+    UNIQUE (name, key)
+);
+
+CREATE INDEX IF NOT EXISTS scheduled_jobs_run_at_idx ON scheduled_jobs (run_at);
@@ -1,19 +1,24 @@
 from __future__ import annotations
 from dataclasses import dataclass
 import datetime
+import functools
 from logging import config
 
 import discord
+from discord import app_commands
 from discord.ext import commands
 
+import asyncio
 import asyncpg
 import aiohttp
 import logging
-from typing import List, Self
+import math
+import time
+from typing import Any, Callable, Coroutine, List, Self
 
 import utils
 
-__all__ = ("NASABot", "NASAContext", "NASAInteraction")
+__all__ = ("NASABot", "NASAContext", "NASAInteraction", "NASATree")
 
 discord.utils.setup_logging()
 _logger = logging.getLogger("NASABot")
@@ -33,74 +38,243 @@ class NASAInteraction(discord.Interaction["NASABot"]):
     # pool: asyncpg.Pool = client.pool
 
 
-class NASABot(commands.Bot):
+class NASATree(app_commands.CommandTree["NASABot"]):
+    """
+    A command tree that records how long each app command takes
+    """
+
+    async def _call(self, interaction: discord.Interaction["NASABot"]) -> None:
+        start = time.perf_counter()
+        try:
+            await super()._call(interaction)
+        finally:
+            command = interaction.command
+            self.client.timings.record(
+                "app_command",
+                command.qualified_name if command else "<unknown>",
+                time.perf_counter() - start,
+                kwargs=dict(interaction.namespace),
+            )
+
+
+class NASABot(commands.AutoShardedBot):
+    EXTENSIONS = (
+        "cogs.errorlog",
+        "cogs.error_handler",
+        "cogs.modmail",
+        "cogs.voices",
+        "cogs.custom_event_handler",
+        "cogs.levelling",
+        "cogs.member_count",
+        "cogs.diagnostics",
+        # "cogs.moderation",
+        # "cogs.testing",
+    )
+    # Loaded by the first cluster only, so their loops don't run once per process
+    SINGLETON_EXTENSIONS = ("cogs.scheduled_tasks",)
+
     def __init__(
         self,
         pool: asyncpg.Pool,
         session: aiohttp.ClientSession,
         config: utils.Configuration,
+        *,
+        shard_ids: list[int] | None = None,
+        shard_count: int | None = None,
+        cluster_id: int = 0,
+        cluster: utils.ClusterClient | None = None,
     ):
+        self.cluster_id = cluster_id
+        self.cluster = cluster
         self.pool: asyncpg.Pool = pool
         self.session = session
+        self.metrics = utils.default_registry
         self.level_manager = utils.LevelManager(self.pool, self)
+        self.scheduler = utils.Scheduler(self.pool, registry=self.metrics)
         self.config = config
+        self.timings = utils.HandlerTimings(
+            self.metrics, threshold=config.slow_handler_threshold
+        )
+        self.user_resolver = utils.Resolver(
+            "users", self.get_user, self.fetch_user, registry=self.metrics
+        )
+        self.channel_resolver = utils.Resolver(
+            "channels", self.get_channel, self.fetch_channel, registry=self.metrics
+        )
 
         self.error_log_file = "/home/pi/.pm2/logs/GXG-Bot-error.log"
         self.stdout_log_file = "/home/pi/.pm2/logs/GXG-Bot-out.log"
 
-        intents = discord.Intents.default()
-        intents.message_content = True
-        intents.members = True
+        # Intents and caching are chosen from what the startup extensions need
+        self.gateway_profile = utils.build_profile(
+            config.gateway_profile, self.startup_extensions
+        )
 
         self.owner_id = 268815279570681857
 
         super().__init__(
             command_prefix=".",
-            intents=intents,
+            **self.gateway_profile.kwargs(),
+            # Needed for on_socket_raw_receive, which the gateway recorder uses
+            enable_debug_events=config.gateway_record_file is not None,
             allowed_mentions=discord.AllowedMentions(
                 everyone=False, users=True, roles=True, replied_user=True
             ),
+            tree_cls=NASATree,
+            shard_ids=shard_ids,
+            shard_count=shard_count,
         )
 
+    @property
+    def is_primary(self) -> bool:
+        """Whether this is the only process or the first cluster"""
+        return self.cluster_id == 0
+
+    @property
+    def startup_extensions(self) -> tuple[str, ...]:
+        extensions = self.EXTENSIONS
+        if self.is_primary:
+            extensions += self.SINGLETON_EXTENSIONS
+        if self.config.load_jishaku:
+            extensions += ("jishaku",)
+        return extensions
+
     async def get_context(self, message, *, cls=NASAContext):
         # when you override this method, you pass your new Context
         # subclass to the super() method, which tells the bot to
         # use the new MyContext class
         return await super().get_context(message, cls=cls)
 
-    async def create_tables(self):
+    async def _run_event(
+        self,
+        coro: Callable[..., Coroutine[Any, Any, Any]],
+        event_name: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        # Every listener, including those in cogs, is run through here
+        start = time.perf_counter()
+        try:
+            await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            self.timings.record(
+                "listener",
+                getattr(coro, "__qualname__", event_name),
+                time.perf_counter() - start,
+                args,
+                kwargs,
+            )
+
+    async def invoke(self, ctx: commands.Context[Self]) -> None:
+        start = time.perf_counter()
+        try:
+            await super().invoke(ctx)
+        finally:
+            if ctx.command is not None:
+                self.timings.record(
+                    "command",
+                    ctx.command.qualified_name,
+                    time.perf_counter() - start,
+                    # Skip the cog and context
+                    ctx.args[2:] if ctx.cog else ctx.args[1:],
+                    ctx.kwargs,
+                )
+
+    async def migrate(self):
         """
         |coro|
 
-        Creates the tables in the database from the schema.sql file
+        Applies any pending migrations from the migrations directory
         """
-        _logger.info("Creating tables")
-        with open("schema.sql") as data:
-            await self.pool.execute(data.read())
-        _logger.info("Tables created")
+        # Imported here so `python -m utils.migrations` doesn't import itself twice
+        from utils.migrations import migrate
+
+        applied = await migrate(self.pool)
+        if applied:
+            _logger.info(
+                f"Applied {len(applied)} migration(s): {', '.join(map(str, applied))}"
+            )
+        else:
+            _logger.info("Database schema is up to date")
 
     async def get_or_fetch(self, user: int) -> discord.Member | discord.User:
-        m = self.get_user(user)
-        if not m:
-            m = await self.fetch_user(user)
+        return await self.user_resolver.resolve(user)
 
-        return m
+    async def get_or_fetch_channel(
+        self, cid: int
+    ) -> discord.abc.GuildChannel | discord.abc.PrivateChannel | discord.Thread:
+        return await self.channel_resolver.resolve(cid)
 
-    async def get_or_fetch_channel(self, cid: int) -> discord.TextChannel:
-        c = self.get_channel(cid)
-        if not c:
-            c = await self.fetch_channel(cid)
+    def cluster_stats(self) -> dict[str, Any]:
+        """A summary of this process, answered to the ``stats`` cluster request"""
+        return {
+            "shards": sorted(self.shards),
+            "guilds": len(self.guilds),
+            "users": len(self.users),
+            "latency": self.latency if math.isfinite(self.latency) else None,
+            "rss": utils.rss_bytes(),
+        }
 
-    async def setup_hook(self):
-        # Set up the level manager
-        await self.level_manager.start()
+    def locate_guild(self, guild_id: int) -> int | None:
+        """Returns the shard of ``guild_id`` if this process holds the guild"""
+        guild = self.get_guild(guild_id)
+        return guild.shard_id if guild else None
+
+    async def find_guild(self, guild_id: int) -> tuple[int, int] | None:
+        """
+        |coro|
+
+        Finds which cluster and shard a guild is on, asking the other clusters if
+        it isn't cached here.
+
+        Parameters
+        ----------
+        guild_id: `int`
+            The guild to look for
+
+        Returns
+        -------
+        `Optional[tuple[int, int]]`
+            The cluster id and shard id, or ``None`` if no cluster holds the guild
+
+        Raises
+        ------
+        `asyncio.TimeoutError`
+            It isn't cached here and not every other cluster answered in time
+        """
+        shard_id = self.locate_guild(guild_id)
+        if shard_id is not None:
+            return self.cluster_id, shard_id
+        if self.cluster is None:
+            return None
+
+        try:
+            results = await self.cluster.request("locate_guild", guild_id=guild_id)
+        except asyncio.TimeoutError:
+            # Not knowing isn't the same as no cluster holding it, so let the caller say so
+            _logger.warning(f"Timed out asking the other clusters for guild {guild_id}")
+            raise
+        for cluster_id, shard_id in sorted(results.items()):
+            if isinstance(shard_id, int):
+                return cluster_id, shard_id
+        return None
 
+    async def load_immune(self):
         self.immune = []
         res: List[asyncpg.Record] = await self.pool.fetch("SELECT * FROM immune")
 
         for r in res:
             self.immune.append(r["id"])
 
+    async def _cache_channel(self, attr: str, channel_id: int):
+        setattr(self, attr, await self.get_or_fetch_channel(channel_id))
+
+    async def setup_hook(self):
+        if self.cluster is not None:
+            self.cluster.add_handler("stats", self.cluster_stats)
+            self.cluster.add_handler("locate_guild", self.locate_guild)
+            self.cluster.start()
+
         if self.config.error_webhook_url:
             self.error_webhook = discord.Webhook.from_url(
                 self.config.error_webhook_url, session=self.session
@@ -108,28 +282,42 @@ class NASABot(commands.Bot):
         else:
             self.error_webhook = None
 
-        await self.load_extension("jishaku")
-        await self.load_extension("cogs.errorlog")
-        await self.load_extension("cogs.error_handler")
-        await self.load_extension("cogs.modmail")
-        await self.load_extension("cogs.voices")
-        await self.load_extension("cogs.scheduled_tasks")
-        await self.load_extension("cogs.custom_event_handler")
-        await self.load_extension("cogs.levelling")
-        # await self.load_extension("cogs.moderation")
-        # await self.load_extension("cogs.testing")
-
-        self.tiktok_channel = self.get_channel(self.config.tiktok_channel)
-        if not self.tiktok_channel:
-            self.tiktok_channel = await self.fetch_channel(self.config.tiktok_channel)
-
-        self.member_channel = self.get_channel(self.config.member_channel)
-        if not self.member_channel:
-            self.member_channel = await self.fetch_channel(self.config.member_channel)
+        # Independent steps run concurrently, the breakdown is logged at the end
+        self.startup = utils.StartupRunner()
+        self.startup.add("migrations", self.migrate)
+        self.startup.add(
+            "level_manager", self.level_manager.start, after=["migrations"]
+        )
+        self.startup.add("immune", self.load_immune, after=["migrations"])
+        for extension in self.startup_extensions:
+            self.startup.add(
+                extension,
+                functools.partial(self.load_extension, extension),
+                after=["migrations"],
+            )
+        self.startup.add(
+            "tiktok_channel",
+            functools.partial(
+                self._cache_channel, "tiktok_channel", self.config.tiktok_channel
+            ),
+        )
+        self.startup.add(
+            "member_channel",
+            functools.partial(
+                self._cache_channel, "member_channel", self.config.member_channel
+            ),
+        )
+
+        _logger.info(self.gateway_profile.describe())
+        await self.startup.run()
+        self.config.start_watching()
+        # Started once every extension has registered its jobs
+        self.scheduler.start()
 
     async def on_ready(self):
         _logger.info(f"Logged in as {self.user}")
 
     async def close(self):
-        self.config.close()
+        await self.scheduler.close()
+        await self.config.close()
         await super().close()
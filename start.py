@@ -2,23 +2,30 @@ import asyncio
 import asyncpg
 import aiohttp
 
+from typing import Any
+
 import utils
 
 from src.bot import NASABot
 
-config = utils.Configuration.get_config()
 
-if utils.test_database_conn(config.db_uri):
-    uri = config.db_uri
-elif utils.test_database_conn(config.dev_uri):
-    uri = config.dev_uri
+def resolve_uri(config: utils.Configuration) -> str:
+    return config.db_uri or config.dev_uri
 
 
-async def run():
-    async with asyncpg.create_pool(uri) as pool, aiohttp.ClientSession() as session:
-        async with NASABot(pool, session, config) as bot:
-            await bot.create_tables()
+async def run(
+    config: utils.Configuration, *, pool_size: int | None = None, **bot_kwargs: Any
+):
+    size = pool_size or config.db_pool_size
+    async with asyncpg.create_pool(
+        resolve_uri(config),
+        min_size=size,
+        max_size=size,
+        init=utils.instrument_connection,
+    ) as pool, aiohttp.ClientSession() as session:
+        async with NASABot(pool, session, config, **bot_kwargs) as bot:
             await bot.start(config.token)  # type: ignore
 
 
-asyncio.run(run())
+if __name__ == "__main__":
+    asyncio.run(run(utils.Configuration.get_config()))
@@ -2,3 +2,19 @@ from .helpers import *
 from .paginator import *
 from .views import *
 from .level_manager import *
+from .relay import *
+from .metrics import *
+from .instrumentation import *
+from .loopmonitor import *
+from .startup import *
+from .lazy import *
+from .resolver import *
+from .profiles import *
+from .recorder import *
+from .cluster import *
+from .cpuprofile import *
+from .memtrace import *
+from .tiktok import *
+from .scheduler import *
+from .logtail import *
+from .timeparse import *
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+from logging import getLogger
+from multiprocessing.connection import Connection
+from typing import Any, Awaitable, Callable
+
+logger = getLogger("NASA.cluster")
+
+__all__ = ("ClusterClient", "split_shards")
+
+Handler = Callable[..., Any | Awaitable[Any]]
+
+
+def split_shards(shard_count: int, clusters: int) -> list[list[int]]:
+    """Splits shard ids into contiguous groups, one per cluster"""
+    clusters = max(1, min(clusters, shard_count))
+    size, extra = divmod(shard_count, clusters)
+    groups = []
+    start = 0
+    for i in range(clusters):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(list(range(start, end)))
+        start = end
+    return groups
+
+
+class ClusterClient:
+    """The bot's end of the pipe to the cluster supervisor.
+
+    Requests are routed by the supervisor to one or every cluster, each of which
+    answers with a handler registered through :meth:`add_handler`.
+
+    Messages are plain dicts:
+
+    - ``{"op": "request", "id", "method", "kwargs", "target"}`` asks a cluster
+      (or every cluster when ``target`` is ``None``) to run a handler
+    - ``{"op": "reply", "id", "result"}`` answers a request
+    - ``{"op": "response", "id", "results"}`` is the supervisor's combined
+      answer, keyed by cluster id
+
+    Parameters
+    ----------
+    conn: `Connection`
+        This process' end of the pipe
+    cluster_id: `int`
+        The id of the cluster this process runs
+    cluster_count: `int`
+        The number of clusters in total
+    """
+
+    def __init__(self, conn: Connection, cluster_id: int, cluster_count: int):
+        self.conn = conn
+        self.cluster_id = cluster_id
+        self.cluster_count = cluster_count
+
+        self._handlers: dict[str, Handler] = {}
+        self._pending: dict[int, asyncio.Future[dict[int, Any]]] = {}
+        self._ids = itertools.count()
+        self._send_lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        """Starts reading from the pipe. Must be called from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.Thread(
+            target=self._read, name="cluster-ipc", daemon=True
+        )
+        self._thread.start()
+
+    def add_handler(self, method: str, func: Handler):
+        """Registers a function that answers requests for ``method``.
+        It's called with the request's keyword arguments and may be a coroutine function.
+        """
+        self._handlers[method] = func
+
+    def _send(self, message: dict[str, Any]):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def _read(self):
+        # Blocking reads happen on this thread, handling happens on the loop
+        assert self._loop is not None
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                logger.warning("Lost the connection to the cluster supervisor")
+                return
+            self._loop.call_soon_threadsafe(self._dispatch, message)
+
+    def _dispatch(self, message: dict[str, Any]):
+        op = message.get("op")
+        if op == "response":
+            future = self._pending.pop(message["id"], None)
+            if future is not None and not future.done():
+                future.set_result(message["results"])
+        elif op == "request":
+            asyncio.create_task(self._answer(message))
+        else:
+            logger.warning(f"Unknown cluster message {op!r}")
+
+    async def _answer(self, message: dict[str, Any]):
+        handler = self._handlers.get(message["method"])
+        if handler is None:
+            result: Any = {"error": f"No handler for {message['method']!r}"}
+        else:
+            try:
+                result = handler(**message["kwargs"])
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except Exception as e:
+                logger.exception(f"Cluster handler {message['method']} failed")
+                result = {"error": f"{e.__class__.__name__}: {e}"}
+
+        self._send({"op": "reply", "id": message["id"], "result": result})
+
+    async def request(
+        self,
+        method: str,
+        *,
+        target: int | None = None,
+        timeout: float = 5.0,
+        **kwargs: Any,
+    ) -> dict[int, Any]:
+        """
+        |coro|
+
+        Runs a handler on another cluster, or on every cluster including this one.
+
+        Parameters
+        ----------
+        method: `str`
+            The handler to run
+        target: `Optional[int]`
+            The cluster to ask, every cluster if ``None``
+        timeout: `float`
+            Seconds to wait for every answer
+
+        Returns
+        -------
+        `dict[int, Any]`
+            Each cluster's answer, keyed by cluster id. Clusters that are down
+            are left out.
+
+        Raises
+        ------
+        `asyncio.TimeoutError`
+            Not every cluster answered in time
+        """
+        request_id = next(self._ids)
+        future: asyncio.Future[dict[int, Any]] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._pending[request_id] = future
+        self._send(
+            {
+                "op": "request",
+                "id": request_id,
+                "method": method,
+                "kwargs": kwargs,
+                "target": target,
+            }
+        )
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
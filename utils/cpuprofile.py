@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from logging import getLogger
+from types import FrameType
+
+logger = getLogger("NASA.cpuprofile")
+
+__all__ = ("CPUProfiler", "ProfileResult", "ProfilerBusy")
+
+# The selector method the loop sits in while it waits for something to do
+_IDLE_FUNCTION = "select"
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running"""
+
+
+@dataclass
+class ProfileResult:
+    mode: str
+    seconds: float
+    filename: str
+    data: bytes
+    samples: int = 0
+    idle: int = 0
+    # (function, share of the busy samples or cumulative seconds)
+    top: list[tuple[str, float]] = field(default_factory=list)
+
+    def summary(self, count: int = 10) -> str:
+        if self.mode == "sample":
+            busy = self.samples - self.idle
+            lines = [
+                (
+                    f"{self.samples} samples over {self.seconds:.1f}s, "
+                    f"loop busy {busy / self.samples:.0%}"
+                    if self.samples
+                    else f"No samples over {self.seconds:.1f}s"
+                )
+            ]
+            lines += [f"{share:>6.1%}  {name}" for name, share in self.top[:count]]
+        else:
+            lines = [f"cProfile over {self.seconds:.1f}s, by cumulative time"]
+            lines += [f"{secs:>7.3f}s  {name}" for name, secs in self.top[:count]]
+        return "\n".join(lines)
+
+
+def _describe(frame: FrameType) -> str:
+    code = frame.f_code
+    # Semicolons separate frames in the collapsed format
+    name = getattr(code, "co_qualname", code.co_name).replace(";", ":")
+    return f"{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class CPUProfiler:
+    """Profiles the event loop thread on demand.
+
+    Nothing is installed until :meth:`run` is called, so there is no cost while it's
+    off, and only one profile can run at a time.
+
+    Two modes are supported:
+
+    - ``sample`` reads the loop thread's stack from another thread every
+      ``interval`` seconds and writes collapsed stacks (one ``root;...;leaf count``
+      line per stack) that flamegraph.pl and speedscope can open. Each stack is
+      rooted at the name of the asyncio task that was running.
+    - ``cprofile`` runs :mod:`cProfile` on the loop thread and writes a pstats
+      file. It's exact but slows every call down while it runs.
+
+    Parameters
+    ----------
+    interval: `float`
+        Seconds between samples in ``sample`` mode
+    """
+
+    MODES = ("sample", "cprofile")
+
+    def __init__(self, *, interval: float = 0.005):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, seconds: float, *, mode: str = "sample") -> ProfileResult:
+        """
+        |coro|
+
+        Profiles the event loop for ``seconds`` seconds.
+
+        Parameters
+        ----------
+        seconds: `float`
+            How long to profile for
+        mode: `str`
+            ``sample`` or ``cprofile``
+
+        Raises
+        ------
+        `ProfilerBusy`
+            Another profile is already running
+        `ValueError`
+            The mode isn't known
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}")
+        if self._lock.locked():
+            raise ProfilerBusy("A profile is already running")
+
+        async with self._lock:
+            logger.info(f"Profiling the event loop for {seconds}s ({mode})")
+            if mode == "sample":
+                return await self._sample(seconds)
+            return await self._cprofile(seconds)
+
+    async def _sample(self, seconds: float) -> ProfileResult:
+        loop = asyncio.get_running_loop()
+        thread_id = threading.get_ident()
+        stacks: Counter[str] = Counter()
+        leaves: Counter[str] = Counter()
+        stop = threading.Event()
+        counts = [0, 0]  # samples, idle
+
+        def sample():
+            while not stop.wait(self.interval):
+                frame = sys._current_frames().get(thread_id)
+                if frame is None:
+                    continue
+                counts[0] += 1
+                idle = frame.f_code.co_name == _IDLE_FUNCTION
+                if idle:
+                    counts[1] += 1
+
+                names = []
+                while frame is not None:
+                    names.append(_describe(frame))
+                    frame = frame.f_back
+                del frame
+
+                # Reading the current task from another thread is racy but good enough here
+                try:
+                    task = asyncio.current_task(loop)
+                except RuntimeError:
+                    task = None
+                names.append(f"task {task.get_name()}" if task else "loop")
+
+                if not idle:
+                    leaves[names[0]] += 1
+                stacks[";".join(reversed(names))] += 1
+
+        thread = threading.Thread(target=sample, name="cpu-profiler", daemon=True)
+        start = time.monotonic()
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(thread.join)
+        elapsed = time.monotonic() - start
+
+        samples, idle = counts
+        busy = samples - idle
+        top = [(name, count / busy) for name, count in leaves.most_common(25)]
+        data = "".join(f"{stack} {count}\n" for stack, count in stacks.items())
+        return ProfileResult(
+            "sample",
+            elapsed,
+            f"profile-{int(time.time())}.collapsed",
+            data.encode("UTF-8"),
+            samples=samples,
+            idle=idle,
+            top=top,
+        )
+
+    async def _cprofile(self, seconds: float) -> ProfileResult:
+        profile = cProfile.Profile()
+        start = time.monotonic()
+        # Only hooks this thread, which is the one running the loop
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        elapsed = time.monotonic() - start
+
+        def dump() -> tuple[bytes, list[tuple[str, float]]]:
+            profile.create_stats()
+            stats = profile.stats  # type: ignore
+            top = sorted(
+                (
+                    (f"{func} ({os.path.basename(file)}:{line})", cumulative)
+                    for (file, line, func), (_, _, _, cumulative, _) in stats.items()
+                ),
+                key=lambda item: item[1],
+                reverse=True,
+            )
+            # The same format pstats.Stats.dump_stats writes
+            return marshal.dumps(stats), top[:25]
+
+        data, top = await asyncio.to_thread(dump)
+        return ProfileResult(
+            "cprofile",
+            elapsed,
+            f"profile-{int(time.time())}.pstats",
+            data,
+            top=top,
+        )
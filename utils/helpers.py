@@ -2,16 +2,22 @@ from __future__ import annotations
 
 import discord
 
+import asyncio
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import Field, dataclass, field, fields
 from enum import Enum
 import asyncpg
 import json
+import os
+import tempfile
+from logging import getLogger
 
-from typing import Optional, Self
+from typing import Any, ClassVar, Optional, Self
 
 # from src.bot import NASAInteraction
 
+logger = getLogger("NASA.config")
+
 __all__ = (
     "ModerationLog",
     "Configuration",
@@ -25,10 +31,16 @@ __all__ = (
 
 class Mode(Enum):
     "Unrated"
+
     "Competitive"
     "Other"
 
 
+def _state(**kwargs) -> Any:
+    # A field for an instance's own state, which isn't an init argument or saved
+    return field(init=False, repr=False, compare=False, **kwargs)
+
+
 @dataclass
 class Configuration:
     warn_threshold: int | None
@@ -46,28 +58,61 @@ class Configuration:
     tiktok_channel: int
     member_channel: int
     join_to_create_ids: list[int] | None
+    modmail_webhook_rate: float = 0.5  # Sends per second before a new webhook is made
+    transcript_dir: str = "transcripts"
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int | None = None  # e.g. 9100 to serve /metrics, off by default
+    slow_handler_threshold: float = 0.5  # Seconds before a handler is logged as slow
+    # Seconds the event loop can block before its stack is logged
+    loop_lag_threshold: float = 0.25
+    load_jishaku: bool = False  # Otherwise it can be loaded with the jishaku command
+    import_time_budget: float = 3.0  # Seconds the bot's modules should take to import
+    gateway_profile: str = "default"  # "lean" only caches what the loaded cogs need
+    gateway_record_file: str | None = None  # Recording for bench/replay.py
+    # Connections in total, cluster.py splits them between processes
+    db_pool_size: int = 10
+    clusters: int = 1  # Processes cluster.py runs the shards in
+    tiktok_username: str = "jayd3nn.x"  # Whose followers the tiktok channel shows
+    member_count_guild: int | None = None  # None counts the guild member_channel is in
+
+    # Not saved to the file
+    # Changes within this many seconds of each other are written once
+    SAVE_DELAY: ClassVar[float] = 1.0
+    WATCH_INTERVAL: ClassVar[float] = 5.0  # Seconds between checks for manual edits
+    _path: str = _state(default="config.json")
+    _mtime: int | None = _state(default=None)
+    _save_handle: asyncio.TimerHandle | None = _state(default=None)
+    _write_task: asyncio.Task[None] | None = _state(default=None)
+    _watch_task: asyncio.Task[None] | None = _state(default=None)
+    # Held while writing so an older write can't finish after a newer one
+    _write_lock: asyncio.Lock = _state(default_factory=asyncio.Lock)
 
     @classmethod
-    def get_config(cls, /) -> Configuration:
-        with open("config.json") as config:
+    def get_config(cls, path: str = "config.json", /) -> Configuration:
+        with open(path) as config:
             data = json.load(config)
 
-        return cls(**data)
-
-    def _update_value(self, item, value) -> Configuration | None:
-        try:
-            with open("config.json") as config:
-                data: dict = json.load(config)
-
-            data[item]
+        self = cls(**data)
+        self._path = path
+        self._mtime = os.stat(path).st_mtime_ns
+        return self
 
-            data[item] = value
+    @classmethod
+    def _saved_fields(cls) -> list[Field]:
+        # The fields that aren't init arguments only hold this instance's state
+        return [f for f in fields(cls) if f.init]
 
-            return self.__init__(**data)
+    def to_dict(self) -> dict[str, Any]:
+        return {f.name: getattr(self, f.name) for f in self._saved_fields()}
 
-        except KeyError:
+    def _update_value(self, item, value) -> Configuration | None:
+        if item not in {f.name for f in self._saved_fields()}:
             return None
 
+        setattr(self, item, value)
+        self.save()
+        return self
+
     def update_log_id(self, _id: int):
         self.log_channel_id = _id
 
@@ -98,13 +143,142 @@ class Configuration:
         else:
             return False
 
+    def _write(self, data: str):
+        try:
+            mtime = os.stat(self._path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if self._mtime is not None and mtime is not None and mtime != self._mtime:
+            # Edited by hand since it was last read or written. Keep the edit, the
+            # watcher reloads it since _mtime is left as it was
+            logger.warning(
+                f"{self._path} was edited while changes were waiting to be saved, "
+                "keeping the edit and dropping the changes"
+            )
+            return
+
+        # Write next to the real file then swap it in, so a crash mid-write
+        # leaves the old config intact
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, tmp = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as config:
+                config.write(data)
+                config.flush()
+                os.fsync(config.fileno())
+            os.replace(tmp, self._path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self._mtime = os.stat(self._path).st_mtime_ns
+
+    async def _flush(self):
+        self._save_handle = None
+        # Serialise on the loop so the snapshot can't change while it's written
+        data = json.dumps(self.to_dict(), indent=4)
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(self._write, data)
+            except Exception:
+                logger.exception(f"Failed to save {self._path}")
+
+    def _start_flush(self):
+        self._write_task = asyncio.create_task(self._flush())
+
     def save(self):
-        items = self.__dict__
-        with open("config.json", "w") as config:
-            json.dump(items, config, indent=4)
+        """Schedules the config to be written to disk.
 
-    def close(self):
-        self.save()
+        Changes made within ``SAVE_DELAY`` seconds of each other are written once,
+        off the event loop. Without a running loop the file is written immediately.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(json.dumps(self.to_dict(), indent=4))
+            return
+
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+        self._save_handle = loop.call_later(self.SAVE_DELAY, self._start_flush)
+
+    async def flush(self):
+        """
+        |coro|
+
+        Writes any pending changes to disk now.
+        """
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            # Waits for a write that's already running before writing again
+            await self._flush()
+        elif self._write_task is not None:
+            await self._write_task
+
+    def _read(self) -> dict[str, Any]:
+        with open(self._path) as config:
+            return json.load(config)
+
+    async def reload(self) -> list[str]:
+        """
+        |coro|
+
+        Re-reads the config file and updates this instance in place, so anything
+        holding a reference to it sees the new values.
+
+        Returns
+        -------
+        `list[str]`
+            The names of the values that changed
+        """
+        data = await asyncio.to_thread(self._read)
+        # Build a new instance first so an invalid file doesn't leave us half updated
+        new = type(self)(**data)
+
+        changed = []
+        for f in self._saved_fields():
+            value = getattr(new, f.name)
+            if getattr(self, f.name) != value:
+                setattr(self, f.name, value)
+                changed.append(f.name)
+        return changed
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.WATCH_INTERVAL)
+            try:
+                mtime = os.stat(self._path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if mtime == self._mtime or self._save_handle is not None:
+                continue
+
+            self._mtime = mtime
+            try:
+                changed = await self.reload()
+            except (ValueError, TypeError) as e:
+                # JSONDecodeError is a ValueError, unknown or missing keys are a TypeError
+                logger.error(f"Ignoring invalid edit to {self._path}: {e}")
+                continue
+
+            if changed:
+                logger.info(f"Reloaded {self._path}, changed: {', '.join(changed)}")
+
+    def start_watching(self):
+        """Starts polling the config file and reloading it when it's edited by hand"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(), name="config-watch")
+
+    async def close(self):
+        """
+        |coro|
+
+        Stops watching the file and writes any pending changes.
+        """
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        await self.flush()
 
 
 @dataclass
@@ -236,10 +410,10 @@ class Muted:
     async def fetch_next(cls, pool: asyncpg.Pool) -> Muted | None:
         now = round(datetime.now().timestamp())
 
+        # expired is a literal so the partial index on active mutes can be used
         res: asyncpg.Record = await pool.fetchrow(
-            "SELECT * FROM muted WHERE expires > $1 AND expired = $2 ORDER BY expires DESC LIMIT 1",
+            "SELECT * FROM muted WHERE expires > $1 AND NOT expired ORDER BY expires DESC LIMIT 1",
             now,
-            False,
         )
 
         return cls(**res)
@@ -264,9 +438,9 @@ class Muted:
 
     @classmethod
     async def check(cls, pool: asyncpg.Pool, id: int) -> Muted | None:
-        query = "SELECT * FROM muted WHERE id=$1 AND expired=$2"
+        query = "SELECT * FROM muted WHERE id=$1 AND NOT expired"
 
-        res: asyncpg.Record | None = await pool.fetchrow(query, id, False)
+        res: asyncpg.Record | None = await pool.fetchrow(query, id)
 
         if not res:
             return None
@@ -275,9 +449,9 @@ class Muted:
 
     @classmethod
     async def premature(cls, pool: asyncpg.Pool, id: int) -> Muted | None:
-        query = "SELECT * FROM muted WHERE id=$1 and expired=$2"
+        query = "SELECT * FROM muted WHERE id=$1 AND NOT expired"
 
-        res: asyncpg.Record | None = await pool.fetchrow(query, id, False)
+        res: asyncpg.Record | None = await pool.fetchrow(query, id)
 
         if res:
             now = round(datetime.now().timestamp())
@@ -421,8 +595,7 @@ class LFGEntry:
         author_id: int,
         gamemode: str,
         players: list[str],
-    ):
-        ...
+    ): ...
 
     @property
     def mentioned_players(self) -> str:
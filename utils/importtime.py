@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+
+from src.bot import NASABot
+
+__all__ = ("ImportTiming", "ImportReport", "parse_importtime", "measure_imports")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Everything start.py imports before connecting, plus the extensions loaded by default
+DEFAULT_MODULES = (
+    "utils",
+    "src.bot",
+    *NASABot.EXTENSIONS,
+    *NASABot.SINGLETON_EXTENSIONS,
+)
+
+_LINE_RE = re.compile(
+    r"^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|(?P<indent> *)(?P<name>\S+)$"
+)
+
+
+@dataclass
+class ImportTiming:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class ImportReport:
+    timings: list[ImportTiming]
+    budget: float | None = None
+
+    @property
+    def total(self) -> float:
+        """Seconds spent importing, counting each top level import once"""
+        return sum(t.cumulative_us for t in self.timings if t.depth == 0) / 1_000_000
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.total > self.budget
+
+    def slowest(self, count: int = 15) -> list[ImportTiming]:
+        return sorted(self.timings, key=lambda t: t.cumulative_us, reverse=True)[:count]
+
+    def format(self, count: int = 15) -> str:
+        lines = [f"{'Module':<45} {'Self':>9} {'Cumulative':>11}"]
+        for t in self.slowest(count):
+            lines.append(
+                f"{t.name[:45]:<45} {t.self_us / 1000:>7.1f}ms {t.cumulative_us / 1000:>9.1f}ms"
+            )
+        total = f"Total: {self.total * 1000:.0f}ms"
+        if self.budget is not None:
+            total += f" (budget {self.budget * 1000:.0f}ms"
+            total += ", OVER BUDGET)" if self.over_budget else ")"
+        lines.append(total)
+        return "\n".join(lines)
+
+
+def parse_importtime(output: str) -> list[ImportTiming]:
+    """Parses the stderr of ``python -X importtime``"""
+    timings = []
+    for line in output.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        timings.append(
+            ImportTiming(
+                match["name"],
+                int(match["self"]),
+                int(match["cumulative"]),
+                # Nested imports are indented by two spaces per level
+                (len(match["indent"]) - 1) // 2,
+            )
+        )
+    return timings
+
+
+def measure_imports(
+    modules: tuple[str, ...] = DEFAULT_MODULES, *, budget: float | None = None
+) -> ImportReport:
+    """Imports modules in a fresh interpreter with ``-X importtime`` and reports the cost.
+
+    This blocks while the subprocess runs, call it from a thread inside the bot.
+
+    Parameters
+    ----------
+    modules: `tuple[str, ...]`
+        The modules to import
+    budget: `Optional[float]`
+        The number of seconds the imports should fit in
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    if result.returncode != 0:
+        # The traceback is the last thing written to stderr
+        raise RuntimeError(
+            f"Importing {', '.join(modules)} failed:\n"
+            + result.stderr.strip().splitlines()[-1]
+        )
+    return ImportReport(parse_importtime(result.stderr), budget)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m utils.importtime",
+        description="Report how long the bot's modules take to import",
+    )
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_MODULES))
+    parser.add_argument(
+        "--budget", type=float, help="Exit with an error if imports take longer (s)"
+    )
+    parser.add_argument("--count", type=int, default=25)
+    args = parser.parse_args()
+
+    report = measure_imports(tuple(args.modules), budget=args.budget)
+    print(report.format(args.count))
+    sys.exit(1 if report.over_budget else 0)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import reprlib
+from logging import getLogger
+from typing import Any, Iterable, NamedTuple
+
+import discord
+
+from .metrics import MetricsRegistry
+
+logger = getLogger("NASA.instrumentation")
+
+__all__ = ("HandlerTimings", "HandlerStats", "summarize_args")
+
+_repr = reprlib.Repr()
+_repr.maxstring = 60
+_repr.maxother = 60
+
+
+def _summarize(value: Any) -> str:
+    # Discord models have huge reprs, the type and id are enough to find them
+    if isinstance(value, (discord.abc.Snowflake, discord.Interaction)) and hasattr(
+        value, "id"
+    ):
+        return f"{type(value).__name__}(id={value.id})"
+    return _repr.repr(value)
+
+
+def summarize_args(
+    args: Iterable[Any] = (), kwargs: dict[str, Any] | None = None, *, limit: int = 300
+) -> str:
+    """Returns a short, single line description of call arguments"""
+    parts = [_summarize(a) for a in args]
+    if kwargs:
+        parts.extend(f"{k}={_summarize(v)}" for k, v in kwargs.items())
+    summary = ", ".join(parts)
+    return summary if len(summary) <= limit else summary[: limit - 3] + "..."
+
+
+class HandlerStats(NamedTuple):
+    kind: str
+    handler: str
+    count: int
+    p50: float
+    p95: float
+    max: float
+
+
+class HandlerTimings:
+    """Records how long listeners and commands take and logs slow invocations.
+
+    Parameters
+    ----------
+    registry: `MetricsRegistry`
+        The registry to record the latency histogram in
+    threshold: `float`
+        Invocations slower than this many seconds are logged with their arguments
+    """
+
+    def __init__(self, registry: MetricsRegistry, *, threshold: float):
+        self.threshold = threshold
+        self.histogram = registry.histogram(
+            "nasa_handler_seconds",
+            "Time taken by listeners and commands",
+            ["kind", "handler"],
+            buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+        )
+
+    def record(
+        self,
+        kind: str,
+        handler: str,
+        elapsed: float,
+        args: Iterable[Any] = (),
+        kwargs: dict[str, Any] | None = None,
+    ):
+        self.histogram.observe(elapsed, kind=kind, handler=handler)
+        if elapsed >= self.threshold:
+            logger.warning(
+                f"Slow {kind} {handler} took {elapsed * 1000:.0f}ms "
+                f"({summarize_args(args, kwargs)})"
+            )
+
+    def slowest(self, count: int = 10) -> list[HandlerStats]:
+        """Returns the handlers with the highest 95th percentile latency"""
+        stats = [
+            HandlerStats(
+                kind,
+                handler,
+                state.count,
+                self.histogram.quantile_of(state, 0.5),
+                self.histogram.quantile_of(state, 0.95),
+                state.max,
+            )
+            for (kind, handler), state in self.histogram.series().items()
+        ]
+        stats.sort(key=lambda s: s.p95, reverse=True)
+        return stats[:count]
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import importlib
+import sys
+import threading
+from logging import getLogger
+from types import ModuleType
+from typing import Any
+
+logger = getLogger("NASA.lazy")
+
+__all__ = ("LazyModule", "lazy_import")
+
+
+class LazyModule(ModuleType):
+    """A stand-in for a module that is only imported on first attribute access.
+
+    Heavy dependencies that are only needed by a few code paths can be bound at
+    module level with :func:`lazy_import` without paying for the import at startup.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lock = threading.Lock()
+        self._module: ModuleType | None = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.__name__)
+                    logger.debug(f"Lazily imported {self.__name__}")
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __dir__(self) -> list[str]:
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyModule {self.__name__!r} ({state})>"
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Returns a module that is imported the first time one of its attributes is used.
+
+    If the module has already been imported it is returned as is.
+
+    Parameters
+    ----------
+    name: `str`
+        The full name of the module, e.g. ``"bs4"``
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
@@ -6,11 +6,19 @@ from dataclasses import dataclass
 from logging import getLogger
 
 from src.bot import NASABot
+from .metrics import default_registry
 
 import discord
 
 logger = getLogger("NASA.levelmanager")
 
+_xp_grants = default_registry.counter(
+    "nasa_xp_grants_total", "Number of times a member was granted xp"
+)
+_xp_granted = default_registry.counter(
+    "nasa_xp_granted_total", "Total amount of xp granted"
+)
+
 
 __all__ = ("NASAMember", "LevelManager")
 
@@ -135,6 +143,8 @@ class LevelManager:
         xp_gain *= member.modifier
 
         member.overflow_xp += round(xp_gain)
+        _xp_grants.inc()
+        _xp_granted.inc(round(xp_gain))
 
         # Calculate the new level of the member (if changed)
 
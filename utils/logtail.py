@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import datetime
+import os
+import re
+from typing import BinaryIO, Iterator, Optional
+
+__all__ = ("tail_file",)
+
+_STAMP_RE = re.compile(r"^\s*(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})")
+
+
+def _reverse_lines(fp: BinaryIO, block_size: int) -> Iterator[bytes]:
+    """Yields the lines of a binary file from last to first, reading backwards in blocks"""
+    fp.seek(0, os.SEEK_END)
+    position = fp.tell()
+    remainder = b""
+    first = True
+
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        fp.seek(position)
+        block = fp.read(read_size) + remainder
+
+        parts = block.split(b"\n")
+        # The first part may be the end of a line that starts in an earlier block
+        remainder = parts.pop(0)
+        if first:
+            first = False
+            if parts and parts[-1] == b"":
+                parts.pop()
+        yield from reversed(parts)
+
+    if not first:
+        yield remainder
+
+
+def _parse_stamp(line: str) -> Optional[datetime.datetime]:
+    match = _STAMP_RE.match(line)
+    if not match:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(f"{match[1]} {match[2]}")
+    except ValueError:
+        return None
+
+
+def tail_file(
+    path: str,
+    *,
+    lines: int = 20,
+    pattern: Optional[re.Pattern[str]] = None,
+    since: Optional[datetime.datetime] = None,
+    block_size: int = 64 * 1024,
+) -> list[str]:
+    """Returns the last lines of a file without reading the whole file.
+
+    This is blocking, run it in a thread when called from the bot.
+
+    Parameters
+    ----------
+    path: `str`
+        The file to read
+    lines: `int`
+        The maximum number of lines to return
+    pattern: `Optional[re.Pattern]`
+        Only return lines matching this pattern
+    since: `Optional[datetime.datetime]`
+        Stop at the first log record older than this (naive, local time).
+        Lines without a timestamp belong to the record above them.
+
+    Returns
+    -------
+    `list[str]`
+        The matching lines, oldest first
+    """
+    results: list[str] = []
+    # Continuation lines (e.g. tracebacks) waiting for the record they belong to
+    pending: list[str] = []
+
+    def accept(line: str) -> bool:
+        if pattern is None or pattern.search(line):
+            results.append(line)
+        return len(results) >= lines
+
+    with open(path, "rb") as fp:
+        for raw in _reverse_lines(fp, block_size):
+            line = raw.decode("utf-8", "replace").rstrip("\r")
+
+            if since is None:
+                if accept(line):
+                    break
+                continue
+
+            stamp = _parse_stamp(line)
+            if stamp is None:
+                pending.append(line)
+                continue
+            if stamp < since:
+                pending.clear()
+                break
+
+            done = False
+            for item in (*pending, line):
+                if accept(item):
+                    done = True
+                    break
+            pending.clear()
+            if done:
+                break
+        else:
+            for item in pending:
+                if accept(item):
+                    break
+
+    results.reverse()
+    return results
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from logging import getLogger
+from typing import Optional
+
+from .metrics import Histogram
+
+logger = getLogger("NASA.loopmonitor")
+
+__all__ = ("LoopLagMonitor",)
+
+
+class LoopLagMonitor:
+    """Measures event loop scheduling delay and catches blocking calls.
+
+    A probe task sleeps for ``interval`` seconds and records how late it wakes up.
+    A watchdog thread checks that the probe keeps running, and if the loop has been
+    stuck for longer than ``threshold`` seconds it captures the loop thread's stack,
+    showing exactly which code is blocking.
+
+    Parameters
+    ----------
+    histogram: `Optional[Histogram]`
+        A histogram to record every lag sample in
+    interval: `float`
+        Seconds between probes
+    threshold: `float`
+        Seconds of lag before the loop is considered blocked
+    report_interval: `float`
+        Seconds between lag percentile summaries in the logs
+    """
+
+    def __init__(
+        self,
+        *,
+        histogram: Optional[Histogram] = None,
+        interval: float = 0.5,
+        threshold: float = 0.25,
+        report_interval: float = 300.0,
+    ):
+        self.histogram = histogram
+        self.interval = interval
+        self.threshold = threshold
+        self.report_interval = report_interval
+
+        self.samples: deque[float] = deque(maxlen=2000)
+        self.stalls = 0
+        self.last_stall: Optional[str] = None
+
+        self._beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Starts the probe and the watchdog. Must be called from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._probe(), name="loop-lag-probe")
+        self._thread = threading.Thread(
+            target=self._watchdog, name="loop-lag-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> str:
+        return (
+            f"p50 {self.percentile(0.5) * 1000:.1f}ms, "
+            f"p95 {self.percentile(0.95) * 1000:.1f}ms, "
+            f"p99 {self.percentile(0.99) * 1000:.1f}ms, "
+            f"max {max(self.samples, default=0) * 1000:.1f}ms, "
+            f"{self.stalls} stall{'s' if self.stalls != 1 else ''}"
+        )
+
+    async def _probe(self):
+        last_report = time.monotonic()
+        while True:
+            start = time.monotonic()
+            self._beat = start
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            self.samples.append(lag)
+            if self.histogram:
+                self.histogram.observe(lag)
+
+            if now - last_report >= self.report_interval:
+                last_report = now
+                logger.info(f"Event loop lag: {self.summary()}")
+
+    def _describe_task(self) -> str:
+        # Reading the current task from another thread is racy but good enough here
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return ""
+        if task is None:
+            return ""
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", repr(coro))
+        return f" in task {task.get_name()} ({name})"
+
+    def _watchdog(self):
+        reported_beat: Optional[float] = None
+        poll = max(0.01, self.threshold / 4)
+
+        while not self._stop.wait(poll):
+            beat = self._beat
+            overdue = time.monotonic() - beat - self.interval
+            if overdue < self.threshold or beat == reported_beat:
+                continue
+
+            # Only report each stall once
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            del frame
+
+            self.stalls += 1
+            self.last_stall = (
+                f"Event loop blocked for at least {overdue * 1000:.0f}ms"
+                f"{self._describe_task()}\n{stack}"
+            )
+            logger.warning(self.last_stall)
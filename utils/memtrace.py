@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import linecache
+import os
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import dataclass
+from logging import getLogger
+
+logger = getLogger("NASA.memtrace")
+
+__all__ = ("MemoryTracer", "SnapshotDiff")
+
+# tracemalloc's own bookkeeping and the import machinery only add noise
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _short_path(path: str) -> str:
+    # Paths inside the bot are shown relative to it, everything else by file name
+    try:
+        relative = os.path.relpath(path)
+    except ValueError:
+        return os.path.basename(path)
+    return os.path.basename(path) if relative.startswith("..") else relative
+
+
+@dataclass
+class SnapshotDiff:
+    old: str
+    new: str
+    stats: list[tracemalloc.StatisticDiff]
+
+    @property
+    def size_diff(self) -> int:
+        return sum(s.size_diff for s in self.stats)
+
+    @property
+    def count_diff(self) -> int:
+        return sum(s.count_diff for s in self.stats)
+
+    @staticmethod
+    def site(stat: tracemalloc.StatisticDiff) -> str:
+        frame = stat.traceback[0]
+        return f"{_short_path(frame.filename)}:{frame.lineno}"
+
+    def top(self, count: int = 10) -> list[tracemalloc.StatisticDiff]:
+        """The sites that grew the most"""
+        return [s for s in self.stats if s.size_diff > 0][:count]
+
+    def format(self) -> str:
+        """Every site that changed, largest change first, with the allocating line"""
+        lines = [
+            f"Diff from {self.old!r} to {self.new!r}: "
+            f"{self.size_diff / 1024:+.1f} KiB in {self.count_diff:+} blocks",
+            "",
+            f"{'Size diff':>12} {'Size':>12} {'Blocks diff':>12} {'Blocks':>9}  Site",
+        ]
+        for stat in self.stats:
+            if not stat.size_diff and not stat.count_diff:
+                continue
+            lines.append(
+                f"{stat.size_diff / 1024:>+10.1f}Ki {stat.size / 1024:>10.1f}Ki "
+                f"{stat.count_diff:>+12} {stat.count:>9}  {self.site(stat)}"
+            )
+            frame = stat.traceback[0]
+            source = linecache.getline(frame.filename, frame.lineno).strip()
+            if source:
+                lines.append(f"{'':>50}{source}")
+        return "\n".join(lines) + "\n"
+
+
+class MemoryTracer:
+    """Named tracemalloc snapshots for finding what keeps growing.
+
+    tracemalloc slows allocations down and uses memory of its own, so it's only
+    running between :meth:`start` and :meth:`stop`. Only the newest ``max_snapshots``
+    snapshots are kept.
+
+    Parameters
+    ----------
+    max_snapshots: `int`
+        Snapshots kept before the oldest is dropped
+    """
+
+    def __init__(self, *, max_snapshots: int = 5):
+        self.max_snapshots = max_snapshots
+        self.snapshots: OrderedDict[
+            str, tuple[datetime.datetime, tracemalloc.Snapshot]
+        ] = OrderedDict()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        """Starts tracing allocations
+
+        Raises
+        ------
+        `RuntimeError`
+            tracemalloc is already running
+        """
+        if tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is already running")
+        # Only the allocating line is kept, which is all the diff groups by
+        tracemalloc.start(1)
+        logger.info("Started tracemalloc")
+
+    def stop(self):
+        """Stops tracing and drops every snapshot"""
+        tracemalloc.stop()
+        self.snapshots.clear()
+        logger.info("Stopped tracemalloc")
+
+    def traced(self) -> tuple[int, int]:
+        """The current and peak size of the traced allocations, in bytes"""
+        return tracemalloc.get_traced_memory()
+
+    async def _take(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc isn't running")
+        # Taking the snapshot has to happen here, filtering it can be done elsewhere
+        raw = tracemalloc.take_snapshot()
+        return await asyncio.to_thread(raw.filter_traces, _FILTERS)
+
+    async def snapshot(self, name: str) -> tracemalloc.Snapshot:
+        """
+        |coro|
+
+        Takes a snapshot and keeps it under ``name``, replacing any snapshot with the
+        same name.
+
+        Raises
+        ------
+        `RuntimeError`
+            tracemalloc isn't running
+        """
+        snapshot = await self._take()
+        self.snapshots.pop(name, None)
+        self.snapshots[name] = (
+            datetime.datetime.now(datetime.timezone.utc),
+            snapshot,
+        )
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return snapshot
+
+    async def diff(self, old: str, new: str | None = None) -> SnapshotDiff:
+        """
+        |coro|
+
+        Compares two snapshots grouped by file and line, in a thread since it can
+        take a while. Without ``new`` the comparison is with a snapshot taken now,
+        which isn't kept so it can't push ``old`` out.
+
+        Raises
+        ------
+        `KeyError`
+            There's no snapshot with one of the names
+        `RuntimeError`
+            ``new`` wasn't given and tracemalloc isn't running
+        """
+        _, old_snapshot = self.snapshots[old]
+        if new is None:
+            new = "now"
+            new_snapshot = await self._take()
+        else:
+            _, new_snapshot = self.snapshots[new]
+        stats = await asyncio.to_thread(new_snapshot.compare_to, old_snapshot, "lineno")
+        return SnapshotDiff(old, new, stats)
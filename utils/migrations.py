@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from logging import getLogger
+
+import asyncpg
+
+logger = getLogger("NASA.migrations")
+
+__all__ = (
+    "Migration",
+    "MigrationError",
+    "load_migrations",
+    "pending_migrations",
+    "migrate",
+)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")
+
+# Arbitrary key for pg_advisory_xact_lock so only one process migrates at a time
+_LOCK_KEY = 0x4E415341
+
+_FILE_RE = re.compile(r"^(?P<version>\d+)_(?P<name>\w+)\.sql$")
+
+
+class MigrationError(Exception):
+    """Raised when the migrations on disk don't match the database"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def checksum(self) -> str:
+        # Line endings are normalised so a checkout on Windows doesn't change it
+        return hashlib.sha256(
+            self.sql.replace("\r\n", "\n").encode("UTF-8")
+        ).hexdigest()
+
+    def __str__(self) -> str:
+        return f"{self.version:04}_{self.name}"
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> list[Migration]:
+    """Loads every numbered ``.sql`` file in a directory, ordered by version"""
+    migrations: dict[int, Migration] = {}
+    for filename in os.listdir(directory):
+        match = _FILE_RE.match(filename)
+        if not match:
+            continue
+        version = int(match["version"])
+        if version in migrations:
+            raise MigrationError(
+                f"Duplicate migration version {version}: {filename} and {migrations[version]}"
+            )
+        with open(os.path.join(directory, filename), encoding="UTF-8") as fp:
+            migrations[version] = Migration(version, match["name"], fp.read())
+
+    return [migrations[v] for v in sorted(migrations)]
+
+
+async def pending_migrations(
+    conn: asyncpg.Connection, migrations: list[Migration]
+) -> list[Migration]:
+    """
+    |coro|
+
+    Returns the migrations that haven't been applied yet.
+    This is a single SELECT, no DDL is run.
+
+    Raises
+    ------
+    `MigrationError`
+        An applied migration was changed or deleted on disk
+    """
+    try:
+        rows = await conn.fetch("SELECT version, checksum FROM schema_migrations")
+    except asyncpg.UndefinedTableError:
+        return list(migrations)
+
+    applied = {r["version"]: r["checksum"] for r in rows}
+    known = {m.version: m for m in migrations}
+
+    for version, checksum in applied.items():
+        migration = known.get(version)
+        if migration is None:
+            raise MigrationError(f"Migration {version} was applied but is missing")
+        if migration.checksum != checksum:
+            raise MigrationError(
+                f"Migration {migration} was changed after being applied"
+            )
+
+    return [m for m in migrations if m.version not in applied]
+
+
+async def migrate(
+    pool: asyncpg.Pool, directory: str = MIGRATIONS_DIR, *, dry_run: bool = False
+) -> list[Migration]:
+    """
+    |coro|
+
+    Applies any pending migrations in a single transaction.
+
+    Parameters
+    ----------
+    pool: `asyncpg.Pool`
+        The pool to migrate
+    directory: `str`
+        The directory holding the migration files
+    dry_run: `bool`
+        Only report what would be applied
+
+    Returns
+    -------
+    `list[Migration]`
+        The migrations that were (or would be) applied
+    """
+    migrations = load_migrations(directory)
+
+    async with pool.acquire() as conn:
+        pending = await pending_migrations(conn, migrations)
+        if not pending or dry_run:
+            return pending
+
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", _LOCK_KEY)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    checksum TEXT NOT NULL,
+                    applied_at BIGINT NOT NULL
+                )
+                """)
+            # Another process may have migrated while we waited for the lock
+            pending = await pending_migrations(conn, migrations)
+
+            for migration in pending:
+                logger.info(f"Applying migration {migration}")
+                await conn.execute(migration.sql)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, name, checksum, applied_at) VALUES ($1, $2, $3, $4)",
+                    migration.version,
+                    migration.name,
+                    migration.checksum,
+                    round(datetime.now().timestamp()),
+                )
+
+    return pending
+
+
+async def _main(args: argparse.Namespace):
+    dsn = args.dsn
+    if dsn is None:
+        from .helpers import Configuration
+
+        config = Configuration.get_config()
+        dsn = config.db_uri or config.dev_uri
+
+    async with asyncpg.create_pool(dsn, min_size=1, max_size=1) as pool:
+        migrations = await migrate(pool, args.directory, dry_run=args.dry_run)
+
+    if not migrations:
+        print("Database is up to date.")
+    for migration in migrations:
+        print(f"{'Pending' if args.dry_run else 'Applied'}: {migration}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m utils.migrations", description="Apply database migrations"
+    )
+    parser.add_argument(
+        "--dsn", help="Database URI, defaults to the one in config.json"
+    )
+    parser.add_argument("--directory", default=MIGRATIONS_DIR)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list pending migrations"
+    )
+    asyncio.run(_main(parser.parse_args()))
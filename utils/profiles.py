@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import json
+import os
+import resource
+import sys
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Iterable
+
+import discord
+
+logger = getLogger("NASA.profiles")
+
+__all__ = (
+    "ExtensionNeeds",
+    "GatewayProfile",
+    "EXTENSION_NEEDS",
+    "PROFILES",
+    "build_profile",
+    "rss_bytes",
+    "record_memory_sample",
+    "load_memory_samples",
+)
+
+
+@dataclass(frozen=True)
+class ExtensionNeeds:
+    """What an extension needs from the gateway to work.
+
+    Parameters
+    ----------
+    intents: `frozenset[str]`
+        Names of :class:`discord.Intents` flags
+    member_cache: `frozenset[str]`
+        Names of :class:`discord.MemberCacheFlags` flags
+    max_messages: `int`
+        How many messages the extension needs kept in the message cache
+    """
+
+    intents: frozenset[str] = frozenset()
+    member_cache: frozenset[str] = frozenset()
+    max_messages: int = 0
+
+
+# Prefix commands work in guilds and DMs for every extension
+_BASE_INTENTS = frozenset(
+    {"guilds", "guild_messages", "dm_messages", "message_content"}
+)
+
+# Keep this up to date when an extension starts listening to a new event or
+# relies on something being cached
+EXTENSION_NEEDS: dict[str, ExtensionNeeds] = {
+    "jishaku": ExtensionNeeds(),
+    "cogs.errorlog": ExtensionNeeds(),
+    "cogs.error_handler": ExtensionNeeds(),
+    "cogs.custom_event_handler": ExtensionNeeds(),
+    "cogs.diagnostics": ExtensionNeeds(),
+    "cogs.levelling": ExtensionNeeds(),
+    # on_user_update is only dispatched for members that are already cached, the
+    # cog chunks the modmail guild itself so that covers members from before startup
+    "cogs.modmail": ExtensionNeeds(
+        intents=frozenset({"members"}), member_cache=frozenset({"joined"})
+    ),
+    # VoiceChannel.members is built from cached members with a voice state
+    "cogs.voices": ExtensionNeeds(
+        intents=frozenset({"voice_states"}), member_cache=frozenset({"voice"})
+    ),
+    "cogs.scheduled_tasks": ExtensionNeeds(),
+    # Member joins and leaves are only dispatched with the members intent
+    "cogs.member_count": ExtensionNeeds(intents=frozenset({"members"})),
+    "cogs.moderation": ExtensionNeeds(
+        intents=frozenset({"members", "moderation"}),
+        member_cache=frozenset({"joined"}),
+    ),
+}
+
+
+@dataclass
+class GatewayProfile:
+    name: str
+    intents: discord.Intents
+    member_cache_flags: discord.MemberCacheFlags
+    chunk_guilds_at_startup: bool
+    max_messages: int | None
+
+    def kwargs(self) -> dict[str, Any]:
+        """The keyword arguments to pass to :class:`commands.Bot`"""
+        return {
+            "intents": self.intents,
+            "member_cache_flags": self.member_cache_flags,
+            "chunk_guilds_at_startup": self.chunk_guilds_at_startup,
+            "max_messages": self.max_messages,
+        }
+
+    def describe(self) -> str:
+        intents = ", ".join(name for name, enabled in self.intents if enabled)
+        cache = ", ".join(name for name, enabled in self.member_cache_flags if enabled)
+        return (
+            f"Profile {self.name}: intents [{intents}], member cache [{cache or 'none'}], "
+            f"chunking {'on' if self.chunk_guilds_at_startup else 'off'}, "
+            f"message cache {self.max_messages or 'off'}"
+        )
+
+
+def _default_profile(extensions: Iterable[str]) -> GatewayProfile:
+    # What the bot always used: everything cached and every guild chunked
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    return GatewayProfile(
+        "default",
+        intents,
+        discord.MemberCacheFlags.from_intents(intents),
+        True,
+        1000,
+    )
+
+
+def _lean_profile(extensions: Iterable[str]) -> GatewayProfile:
+    intent_names = set(_BASE_INTENTS)
+    cache_names: set[str] = set()
+    max_messages = 0
+
+    for extension in extensions:
+        needs = EXTENSION_NEEDS.get(extension)
+        if needs is None:
+            # Unknown extensions get everything the default profile has
+            logger.warning(
+                f"{extension} has no entry in EXTENSION_NEEDS, using the default profile"
+            )
+            return _default_profile(extensions)
+        intent_names |= needs.intents
+        cache_names |= needs.member_cache
+        max_messages = max(max_messages, needs.max_messages)
+
+    intents = discord.Intents.none()
+    for name in intent_names:
+        setattr(intents, name, True)
+
+    member_cache_flags = discord.MemberCacheFlags.none()
+    for name in cache_names:
+        setattr(member_cache_flags, name, True)
+
+    return GatewayProfile(
+        "lean",
+        intents,
+        member_cache_flags,
+        # Members are cached as they show up instead of all at once
+        False,
+        max_messages or None,
+    )
+
+
+PROFILES = {
+    "default": _default_profile,
+    "lean": _lean_profile,
+}
+
+
+def build_profile(name: str, extensions: Iterable[str]) -> GatewayProfile:
+    """Builds the gateway settings for a profile from the extensions that will be loaded
+
+    Parameters
+    ----------
+    name: `str`
+        One of the names in :data:`PROFILES`
+    extensions: `Iterable[str]`
+        The extensions the bot loads at startup
+    """
+    try:
+        factory = PROFILES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown gateway profile {name!r}, expected one of {', '.join(PROFILES)}"
+        ) from None
+    return factory(tuple(extensions))
+
+
+def rss_bytes() -> int:
+    """Returns the resident set size of this process"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Not on Linux, this is the peak rather than the current size
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def load_memory_samples(path: str) -> dict[str, dict[str, Any]]:
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_memory_sample(path: str, profile: str, **sample: Any) -> dict[str, Any]:
+    """Stores the latest memory sample for a profile so profiles can be compared
+    across restarts.
+
+    Returns
+    -------
+    `dict[str, dict[str, Any]]`
+        Every stored sample, keyed by profile name
+    """
+    samples = load_memory_samples(path)
+    samples[profile] = {"rss": rss_bytes(), "timestamp": round(time.time()), **sample}
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fp:
+        json.dump(samples, fp, indent=4)
+    os.replace(tmp, path)
+    return samples
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import time
+from logging import getLogger
+from typing import IO, Any, Iterator, NamedTuple
+
+logger = getLogger("NASA.recorder")
+
+__all__ = ("GatewayRecorder", "RecordedEvent", "read_recording")
+
+_DISPATCH = 0
+
+
+class RecordedEvent(NamedTuple):
+    offset: float  # Seconds since the recording started
+    type: str
+    data: Any
+
+
+class GatewayRecorder:
+    """Writes gateway dispatch payloads to a gzip compressed JSONL file.
+
+    Feed it the raw payloads from ``on_socket_raw_receive``, which discord.py only
+    dispatches when the bot is created with ``enable_debug_events=True``. Payloads
+    are buffered as they arrive, without being parsed, and written from a thread so
+    recording doesn't block the event loop. Each line holds the raw payload, which
+    :func:`read_recording` parses and filters down to dispatches.
+
+    Parameters
+    ----------
+    path: `str`
+        The file to write to, it is overwritten
+    flush_interval: `float`
+        Seconds between writes
+    max_buffer: `int`
+        Buffered lines that trigger an early write
+    """
+
+    def __init__(
+        self, path: str, *, flush_interval: float = 1.0, max_buffer: int = 500
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.recorded = 0
+
+        self._start = time.monotonic()
+        self._buffer: list[tuple[float, str | bytes]] = []
+        self._file: IO[str] | None = None
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task[None] | None = None
+        self._pending: set[asyncio.Task[None]] = set()
+
+    def start(self):
+        self._file = gzip.open(self.path, "wt", encoding="UTF-8")
+        self._start = time.monotonic()
+        self._task = asyncio.create_task(self._flush_loop(), name="gateway-recorder")
+        logger.info(f"Recording gateway events to {self.path}")
+
+    def record(self, raw: str | bytes):
+        """Buffers a raw gateway payload"""
+        # Every event goes through here, so parsing is left to the reader
+        self._buffer.append((time.monotonic() - self._start, raw))
+        self.recorded += 1
+        if len(self._buffer) >= self.max_buffer:
+            task = asyncio.create_task(self.flush())
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    def _write(self, payloads: list[tuple[float, str | bytes]]):
+        assert self._file is not None
+        lines = []
+        for offset, raw in payloads:
+            if isinstance(raw, bytes):
+                raw = raw.decode("UTF-8")
+            # Newlines can only be whitespace between tokens, strings escape them
+            raw = raw.replace("\n", " ")
+            lines.append(f'{{"ts":{offset:.4f},"p":{raw}}}')
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+
+    async def flush(self):
+        """
+        |coro|
+
+        Writes every buffered payload to the file.
+        """
+        async with self._lock:
+            if not self._buffer or self._file is None:
+                return
+            payloads, self._buffer = self._buffer, []
+            await asyncio.to_thread(self._write, payloads)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception(f"Failed to write gateway recording to {self.path}")
+
+    async def close(self):
+        """
+        |coro|
+
+        Writes anything still buffered and closes the file.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        await self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        logger.info(f"Recorded {self.recorded} gateway payloads to {self.path}")
+
+
+def read_recording(path: str) -> Iterator[RecordedEvent]:
+    """Reads the dispatches written by :class:`GatewayRecorder`, in order"""
+    with gzip.open(path, "rt", encoding="UTF-8") as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "p" not in entry:
+                # Written before raw payloads were recorded
+                yield RecordedEvent(entry["ts"], entry["t"], entry["d"])
+                continue
+            payload = entry["p"]
+            if payload.get("op") == _DISPATCH:
+                yield RecordedEvent(entry["ts"], payload["t"], payload["d"])
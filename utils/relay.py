@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import tempfile
+import time
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import IO, Self
+
+import aiohttp
+import discord
+
+from .metrics import default_registry
+
+logger = getLogger("NASA.relay")
+
+_relay_seconds = default_registry.histogram(
+    "nasa_modmail_attachment_relay_seconds",
+    "Time taken to fetch the attachments of a modmail message",
+)
+
+__all__ = ("ByteBudget", "AttachmentRelay", "RelayedAttachments")
+
+
+class ByteBudget:
+    """A semaphore counted in bytes rather than slots.
+
+    Reservations larger than the whole budget are clamped so that a single
+    oversized attachment can still go through on its own.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, amount: int) -> int:
+        amount = min(amount, self.limit)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_use + amount <= self.limit)
+            self.in_use += amount
+        return amount
+
+    async def release(self, amount: int):
+        async with self._condition:
+            self.in_use -= amount
+            self._condition.notify_all()
+
+
+@dataclass
+class RelayedAttachments:
+    """The result of relaying the attachments of a single message.
+
+    Use as an async context manager so that memory reservations are released
+    and temporary files are removed once the files have been sent.
+    """
+
+    budget: ByteBudget
+    files: list[discord.File] = field(default_factory=list)
+    skipped: list[discord.Attachment] = field(default_factory=list)
+    failed: list[discord.Attachment] = field(default_factory=list)
+    elapsed: float = 0.0
+    _reserved: int = 0
+    _buffers: list[IO[bytes]] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return len(self.files) + len(self.skipped) + len(self.failed)
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def close(self):
+        for buffer in self._buffers:
+            buffer.close()
+        self._buffers.clear()
+        if self._reserved:
+            await self.budget.release(self._reserved)
+            self._reserved = 0
+
+
+class AttachmentRelay:
+    """Downloads message attachments concurrently under a global memory budget.
+
+    Attachments at or below ``spool_threshold`` bytes are kept in memory, larger
+    ones are streamed into temporary files on disk. Attachments that are over the
+    destination's upload limit are skipped before anything is downloaded.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        *,
+        memory_budget: int = 32 * 1024 * 1024,
+        spool_threshold: int = 1024 * 1024,
+    ):
+        self.session = session
+        self.budget = ByteBudget(memory_budget)
+        self.spool_threshold = spool_threshold
+
+    async def _download(self, attachment: discord.Attachment) -> IO[bytes]:
+        if attachment.size <= self.spool_threshold:
+            buffer: IO[bytes] = io.BytesIO()
+        else:
+            buffer = tempfile.SpooledTemporaryFile(max_size=self.spool_threshold)
+
+        try:
+            async with self.session.get(attachment.url) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.content.iter_chunked(self.CHUNK_SIZE):
+                    if isinstance(buffer, io.BytesIO):
+                        buffer.write(chunk)
+                    else:
+                        # Rolled over buffers write to disk
+                        await asyncio.to_thread(buffer.write, chunk)
+        except BaseException:
+            buffer.close()
+            raise
+
+        buffer.seek(0)
+        return buffer
+
+    async def relay(
+        self, attachments: list[discord.Attachment], *, limit: int
+    ) -> RelayedAttachments:
+        """
+        |coro|
+
+        Fetches every attachment under ``limit`` bytes concurrently.
+
+        Parameters
+        ----------
+        attachments: `list[discord.Attachment]`
+            The attachments to fetch
+        limit: `int`
+            The upload limit of the destination, usually ``guild.filesize_limit``
+
+        Returns
+        -------
+        `RelayedAttachments`
+            The files ready to send, along with what was skipped or failed
+        """
+        start = time.perf_counter()
+        result = RelayedAttachments(self.budget)
+
+        wanted: list[discord.Attachment] = []
+        for a in attachments:
+            if a.size >= limit:
+                result.skipped.append(a)
+            else:
+                wanted.append(a)
+
+        if wanted:
+            # Only the in-memory part of a download counts against the budget
+            reservation = sum(min(a.size, self.spool_threshold) for a in wanted)
+            result._reserved = await self.budget.acquire(reservation)
+
+            tasks = [asyncio.ensure_future(self._download(a)) for a in wanted]
+            try:
+                downloads = await asyncio.gather(*tasks, return_exceptions=True)
+            except BaseException:
+                # Cancelling the gather cancels the downloads still running, which
+                # close their own buffers. The finished ones are lost with the
+                # gather's result, so close them here.
+                for task in tasks:
+                    if task.done() and not task.cancelled() and not task.exception():
+                        task.result().close()
+                await result.close()
+                raise
+            for a, buffer in zip(wanted, downloads):
+                if isinstance(buffer, BaseException):
+                    logger.warning(
+                        f"Could not fetch attachment {a.id}", exc_info=buffer
+                    )
+                    result.failed.append(a)
+                    continue
+                result._buffers.append(buffer)
+                result.files.append(
+                    discord.File(
+                        buffer,  # type: ignore  Spooled files are file-like
+                        filename=a.filename,
+                        spoiler=a.is_spoiler(),
+                        description=a.description,
+                    )
+                )
+
+        result.elapsed = time.perf_counter() - start
+        if attachments:
+            _relay_seconds.observe(result.elapsed)
+            logger.info(
+                f"Relayed {len(result.files)}/{len(attachments)} attachments in {result.elapsed * 1000:.1f}ms"
+            )
+        return result
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Generic, NamedTuple, Optional, TypeVar
+
+import aiohttp
+import discord
+
+from .metrics import MetricsRegistry
+
+logger = getLogger("NASA.resolver")
+
+__all__ = ("Resolver", "ResolverStats")
+
+T = TypeVar("T")
+
+
+class ResolverStats(NamedTuple):
+    hits: int
+    misses: int
+    coalesced: int
+    negative: int
+    cached: int
+    inflight: int
+
+
+class Resolver(Generic[T]):
+    """Looks up discord objects by id, falling back to the API on a cache miss.
+
+    Concurrent misses for the same id share one API call, objects that had to be
+    fetched are kept for ``ttl`` seconds, and ids that came back as
+    :class:`discord.NotFound` are remembered for ``negative_ttl`` seconds so
+    deleted users and channels don't cost a request every time.
+
+    Parameters
+    ----------
+    name: `str`
+        Used as the ``resolver`` label on the metrics
+    get: `Callable[[int], Optional[T]]`
+        Looks the id up in the gateway cache, e.g. ``bot.get_user``
+    fetch: `Callable[[int], Awaitable[T]]`
+        Fetches the id from the API, e.g. ``bot.fetch_user``
+    registry: `MetricsRegistry`
+        The registry to record hit, miss and coalesced counts in
+    ttl: `float`
+        Seconds to keep fetched objects
+    negative_ttl: `float`
+        Seconds to remember that an id doesn't exist
+    maxsize: `int`
+        The most fetched objects (and missing ids) to keep
+    """
+
+    def __init__(
+        self,
+        name: str,
+        get: Callable[[int], Optional[T]],
+        fetch: Callable[[int], Awaitable[T]],
+        *,
+        registry: MetricsRegistry,
+        ttl: float = 300.0,
+        negative_ttl: float = 600.0,
+        maxsize: int = 1000,
+    ):
+        self.name = name
+        self._get = get
+        self._fetch = fetch
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+
+        self._cache: OrderedDict[int, tuple[float, T]] = OrderedDict()
+        # What a fresh NotFound is built from, the original isn't kept so its
+        # traceback doesn't grow every time it's raised again
+        self._missing: OrderedDict[
+            int, tuple[float, tuple[aiohttp.ClientResponse, dict[str, Any]]]
+        ] = OrderedDict()
+        self._inflight: dict[int, asyncio.Task[T]] = {}
+
+        self._counter = registry.counter(
+            "nasa_resolver_lookups_total",
+            "Resolver lookups by how they were answered",
+            ["resolver", "result"],
+        )
+        self._counts = {"hit": 0, "miss": 0, "coalesced": 0, "negative": 0}
+
+    def _count(self, result: str):
+        self._counts[result] += 1
+        self._counter.inc(resolver=self.name, result=result)
+
+    @staticmethod
+    def _lookup(cache: OrderedDict, key: int):
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return entry
+
+    def _store(self, cache: OrderedDict, key: int, ttl: float, value):
+        cache[key] = (time.monotonic() + ttl, value)
+        cache.move_to_end(key)
+        while len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    async def _do_fetch(self, key: int) -> T:
+        try:
+            obj = await self._fetch(key)
+        except discord.NotFound as e:
+            self._store(
+                self._missing,
+                key,
+                self.negative_ttl,
+                (e.response, {"code": e.code, "message": e.text}),
+            )
+            raise
+
+        self._store(self._cache, key, self.ttl, obj)
+        return obj
+
+    def _fetch_done(self, key: int, task: asyncio.Task[T]):
+        self._inflight.pop(key, None)
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def resolve(self, key: int) -> T:
+        """
+        |coro|
+
+        Returns the object with this id.
+
+        Raises
+        ------
+        `discord.NotFound`
+            The object doesn't exist, this may be a remembered result
+        `discord.HTTPException`
+            Fetching the object failed
+        """
+        obj = self._get(key)
+        if obj is None:
+            entry = self._lookup(self._cache, key)
+            obj = entry[1] if entry else None
+        if obj is not None:
+            self._count("hit")
+            return obj
+
+        missing = self._lookup(self._missing, key)
+        if missing is not None:
+            self._count("negative")
+            raise discord.NotFound(*missing[1])
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count("coalesced")
+        else:
+            self._count("miss")
+            task = asyncio.create_task(
+                self._do_fetch(key), name=f"resolve-{self.name}-{key}"
+            )
+            task.add_done_callback(lambda t: self._fetch_done(key, t))
+            self._inflight[key] = task
+
+        # Shielded so one caller being cancelled doesn't fail the others
+        return await asyncio.shield(task)
+
+    def invalidate(self, key: int):
+        """Forgets anything cached for this id"""
+        self._cache.pop(key, None)
+        self._missing.pop(key, None)
+
+    def stats(self) -> ResolverStats:
+        return ResolverStats(
+            self._counts["hit"],
+            self._counts["miss"],
+            self._counts["coalesced"],
+            self._counts["negative"],
+            len(self._cache),
+            len(self._inflight),
+        )
@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import heapq
+import json
+import random
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Literal
+
+import asyncpg
+
+from .metrics import MetricsRegistry, default_registry
+
+logger = getLogger("NASA.scheduler")
+
+__all__ = ("Job", "JobHandler", "Scheduler")
+
+CatchUp = Literal["skip", "run_once", "run_all"]
+
+# A job more than this many runs behind only catches up this many under run_all
+_MAX_CATCH_UP = 50
+
+
+@dataclass
+class Job:
+    id: int
+    name: str
+    key: str
+    payload: dict[str, Any]
+    run_at: int  # When this run was due
+    interval: int | None
+    last_run_at: int | None = None
+
+    @property
+    def lateness(self) -> float:
+        return max(0.0, time.time() - self.run_at)
+
+    @property
+    def next_run(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.run_at, datetime.timezone.utc)
+
+    @classmethod
+    def from_record(cls, record: asyncpg.Record) -> Job:
+        return cls(
+            record["id"],
+            record["name"],
+            record["key"],
+            json.loads(record["payload"]),
+            record["run_at"],
+            record["interval_seconds"],
+            record["last_run_at"],
+        )
+
+
+@dataclass
+class JobHandler:
+    func: Callable[[Job], Awaitable[Any]]
+    catch_up: CatchUp
+    grace: float
+    jitter: float
+
+
+class Scheduler:
+    """Runs jobs stored in the ``scheduled_jobs`` table, so they survive restarts.
+
+    Cogs :meth:`register` a coroutine function under a name and then
+    :meth:`schedule` one-off runs or keep a recurring job with :meth:`every`. Due
+    jobs are kept in a heap and one task sleeps until the next one. The table is
+    re-read every ``poll_interval`` seconds to pick up jobs scheduled by other
+    processes.
+
+    A job is claimed with ``FOR UPDATE SKIP LOCKED`` and moved to its next run (or
+    deleted) in the same transaction, before it runs, so each run happens at most
+    once even with several processes polling. A run that crashes isn't retried.
+
+    When a recurring job is found more than ``grace`` seconds late, e.g. after
+    downtime, its ``catch_up`` policy decides what happens to the missed runs:
+
+    - ``skip`` drops them and waits for the next one
+    - ``run_once`` runs once for all of them
+    - ``run_all`` runs once for each of them, up to 50
+
+    One-off jobs that are late run unless their policy is ``skip``.
+
+    Parameters
+    ----------
+    pool: `asyncpg.Pool`
+        The pool holding the ``scheduled_jobs`` table
+    registry: `MetricsRegistry`
+        Where to record lateness and runs
+    poll_interval: `float`
+        Seconds between reads of the table
+    """
+
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        *,
+        registry: MetricsRegistry = default_registry,
+        poll_interval: float = 30.0,
+    ):
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.handlers: dict[str, JobHandler] = {}
+
+        self._heap: list[tuple[float, int, int]] = []  # (fire at, job id, run at)
+        # The run each queued job is waiting for, older heap entries are ignored
+        self._queued: dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._running: set[asyncio.Task[None]] = set()
+
+        self._lateness = registry.histogram(
+            "nasa_scheduler_lateness_seconds",
+            "How long after it was due a scheduled job started",
+            ["job"],
+            buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600, 21600),
+        )
+        self._runs = registry.counter(
+            "nasa_scheduler_runs_total",
+            "Scheduled job runs by outcome",
+            ["job", "result"],
+        )
+
+    def register(
+        self,
+        name: str,
+        func: Callable[[Job], Awaitable[Any]],
+        *,
+        catch_up: CatchUp = "run_once",
+        grace: float = 60.0,
+        jitter: float = 0.0,
+    ):
+        """Registers the coroutine function that runs the jobs called ``name``.
+
+        Jobs already in the table are only queued when it's next read, so a handler
+        registered after :meth:`start` can wait up to ``poll_interval`` seconds for
+        its first run. Jobs it schedules itself are queued straight away.
+
+        Parameters
+        ----------
+        name: `str`
+            The name jobs are scheduled under
+        func: `Callable[[Job], Awaitable[Any]]`
+            Called with the :class:`Job` for each run
+        catch_up: `str`
+            What to do with missed runs, ``skip``, ``run_once`` or ``run_all``
+        grace: `float`
+            Seconds a run can be late before it counts as missed
+        jitter: `float`
+            Up to this many seconds are added to each run at random, so jobs that are
+            due together don't all start together
+        """
+        if catch_up not in ("skip", "run_once", "run_all"):
+            raise ValueError(f"Unknown catch up policy {catch_up!r}")
+        self.handlers[name] = JobHandler(func, catch_up, grace, jitter)
+        self._wakeup.set()
+
+    def unregister(self, name: str):
+        self.handlers.pop(name, None)
+
+    async def schedule(
+        self,
+        name: str,
+        *,
+        at: datetime.datetime | None = None,
+        delay: float = 0.0,
+        key: str = "",
+        payload: dict[str, Any] | None = None,
+        interval: float | None = None,
+    ) -> Job:
+        """
+        |coro|
+
+        Schedules a job, replacing any job with the same name and key.
+
+        Parameters
+        ----------
+        name: `str`
+            The registered handler to run
+        at: `Optional[datetime.datetime]`
+            When to run, otherwise ``delay`` seconds from now
+        delay: `float`
+            Seconds from now to run
+        key: `str`
+            Tells apart jobs with the same name
+        payload: `Optional[dict[str, Any]]`
+            JSON data passed to the handler
+        interval: `Optional[float]`
+            Seconds between runs, the job only runs once if ``None``
+        """
+        run_at = at.timestamp() if at else time.time() + delay
+        record = await self.pool.fetchrow(
+            """
+            INSERT INTO scheduled_jobs (name, key, payload, run_at, interval_seconds)
+            VALUES ($1, $2, $3::jsonb, $4, $5)
+            ON CONFLICT (name, key) DO UPDATE
+            SET payload = EXCLUDED.payload,
+                run_at = EXCLUDED.run_at,
+                interval_seconds = EXCLUDED.interval_seconds
+            RETURNING *
+            """,
+            name,
+            key,
+            json.dumps(payload or {}),
+            round(run_at),
+            round(interval) if interval else None,
+        )
+        job = Job.from_record(record)
+        self._push(job.id, job.name, job.run_at)
+        return job
+
+    async def every(
+        self,
+        name: str,
+        interval: float,
+        *,
+        key: str = "",
+        payload: dict[str, Any] | None = None,
+        delay: float = 0.0,
+        replace_payload: bool = False,
+    ) -> Job:
+        """
+        |coro|
+
+        Makes sure a recurring job exists. Unlike :meth:`schedule` an existing job
+        keeps its next run and its payload, so restarting doesn't reset the timer or
+        any state the job keeps there.
+
+        Parameters
+        ----------
+        name: `str`
+            The registered handler to run
+        interval: `float`
+            Seconds between runs
+        key: `str`
+            Tells apart jobs with the same name
+        payload: `Optional[dict[str, Any]]`
+            JSON data passed to the handler
+        delay: `float`
+            Seconds from now until the first run, if the job is new
+        replace_payload: `bool`
+            Whether an existing job's payload is replaced with ``payload``
+        """
+        record = await self.pool.fetchrow(
+            """
+            INSERT INTO scheduled_jobs (name, key, payload, run_at, interval_seconds)
+            VALUES ($1, $2, $3::jsonb, $4, $5)
+            ON CONFLICT (name, key) DO UPDATE
+            SET payload = CASE WHEN $6 THEN EXCLUDED.payload ELSE scheduled_jobs.payload END,
+                interval_seconds = EXCLUDED.interval_seconds
+            RETURNING *
+            """,
+            name,
+            key,
+            json.dumps(payload or {}),
+            round(time.time() + delay),
+            round(interval),
+            replace_payload,
+        )
+        job = Job.from_record(record)
+        self._push(job.id, job.name, job.run_at)
+        return job
+
+    async def cancel(self, name: str, key: str = "") -> bool:
+        """
+        |coro|
+
+        Deletes a job, returning whether there was one.
+        """
+        result = await self.pool.execute(
+            "DELETE FROM scheduled_jobs WHERE name = $1 AND key = $2", name, key
+        )
+        return result != "DELETE 0"
+
+    async def jobs(self) -> list[Job]:
+        """
+        |coro|
+
+        Every scheduled job, soonest first.
+        """
+        records = await self.pool.fetch("SELECT * FROM scheduled_jobs ORDER BY run_at")
+        return [Job.from_record(r) for r in records]
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="scheduler")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for task in self._running:
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _push(self, job_id: int, name: str, run_at: int):
+        handler = self.handlers.get(name)
+        if handler is None or self._queued.get(job_id) == run_at:
+            return
+        fire_at = run_at + (random.uniform(0, handler.jitter) if handler.jitter else 0)
+        heapq.heappush(self._heap, (fire_at, job_id, run_at))
+        self._queued[job_id] = run_at
+        self._wakeup.set()
+
+    async def _load(self):
+        # Only what's due before the next read, the rest is picked up then
+        records = await self.pool.fetch(
+            "SELECT id, name, run_at FROM scheduled_jobs WHERE name = ANY($1::text[]) AND run_at <= $2",
+            list(self.handlers),
+            round(time.time() + self.poll_interval),
+        )
+        for record in records:
+            self._push(record["id"], record["name"], record["run_at"])
+
+    async def _run(self):
+        next_load = 0.0
+        while True:
+            now = time.time()
+            if now >= next_load:
+                try:
+                    await self._load()
+                except Exception:
+                    logger.exception("Failed to read scheduled jobs")
+                next_load = now + self.poll_interval
+
+            while self._heap and self._heap[0][0] <= time.time():
+                _, job_id, run_at = heapq.heappop(self._heap)
+                if self._queued.get(job_id) != run_at:
+                    # The job was rescheduled since this was queued
+                    continue
+                del self._queued[job_id]
+                task = asyncio.create_task(self._claim_and_run(job_id))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            until = next_load
+            if self._heap:
+                until = min(until, self._heap[0][0])
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=max(0.0, until - time.time())
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(
+        self, job_id: int
+    ) -> tuple[Job, JobHandler, int, int | None] | None:
+        """Takes a due job and moves it on, returning it with how many times to run it
+        and when it runs next"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                record = await conn.fetchrow(
+                    """
+                    SELECT * FROM scheduled_jobs
+                    WHERE id = $1 AND run_at <= $2
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    job_id,
+                    int(time.time()),
+                )
+                # Taken by another process, rescheduled or cancelled
+                if record is None:
+                    return None
+                job = Job.from_record(record)
+                handler = self.handlers.get(job.name)
+                if handler is None:
+                    return None
+
+                now = time.time()
+                runs = self._runs_due(job, handler, now)
+                if job.interval is None:
+                    await conn.execute(
+                        "DELETE FROM scheduled_jobs WHERE id = $1", job.id
+                    )
+                    return job, handler, runs, None
+
+                # The next run that's still ahead, keeping to the job's timetable
+                missed = int((now - job.run_at) // job.interval) + 1
+                next_run = job.run_at + missed * job.interval
+                await conn.execute(
+                    "UPDATE scheduled_jobs SET run_at = $2, last_run_at = $3 WHERE id = $1",
+                    job.id,
+                    next_run,
+                    round(now),
+                )
+                return job, handler, runs, next_run
+
+    def _runs_due(self, job: Job, handler: JobHandler, now: float) -> int:
+        late = now - job.run_at
+        if late <= handler.grace:
+            return 1
+        if handler.catch_up == "skip":
+            return 0
+        if handler.catch_up == "run_all" and job.interval:
+            return min(int(late // job.interval) + 1, _MAX_CATCH_UP)
+        return 1
+
+    async def _claim_and_run(self, job_id: int):
+        try:
+            claimed = await self._claim(job_id)
+        except Exception:
+            logger.exception(f"Failed to claim scheduled job {job_id}")
+            return
+        if claimed is None:
+            return
+
+        job, handler, runs, next_run = claimed
+        if next_run is not None:
+            self._push(job.id, job.name, next_run)
+
+        if runs == 0:
+            logger.info(f"Skipped job {job.name} ({job.key}), {job.lateness:.0f}s late")
+            self._runs.inc(job=job.name, result="skipped")
+            return
+
+        for _ in range(runs):
+            self._lateness.observe(job.lateness, job=job.name)
+            try:
+                await handler.func(job)
+            except Exception:
+                logger.exception(f"Scheduled job {job.name} ({job.key}) failed")
+                self._runs.inc(job=job.name, result="error")
+            else:
+                self._runs.inc(job=job.name, result="ok")
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Iterable
+
+logger = getLogger("NASA.startup")
+
+__all__ = ("StartupStep", "StartupRunner")
+
+
+@dataclass
+class StartupStep:
+    name: str
+    func: Callable[[], Awaitable[Any]]
+    after: tuple[str, ...] = ()
+    # Filled in once the step has run, relative to the start of the runner
+    started: float | None = None
+    finished: float | None = None
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+class StartupRunner:
+    """Runs startup steps concurrently, each one starting as soon as the steps it
+    depends on have finished.
+
+    Steps are coroutine functions added with :meth:`add`. If any step fails the
+    remaining steps are cancelled and the error is raised from :meth:`run`.
+    """
+
+    def __init__(self):
+        self.steps: dict[str, StartupStep] = {}
+        self.elapsed: float = 0.0
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        *,
+        after: Iterable[str] = (),
+    ):
+        if name in self.steps:
+            raise ValueError(f"Startup step {name!r} was added twice")
+        self.steps[name] = StartupStep(name, func, tuple(after))
+
+    def _ordered(self) -> list[StartupStep]:
+        """Returns the steps in dependency order, checking for unknown steps and cycles"""
+        ordered: list[StartupStep] = []
+        state: dict[str, int] = {}  # 1 = visiting, 2 = done
+
+        def visit(step: StartupStep, path: tuple[str, ...]):
+            if state.get(step.name) == 2:
+                return
+            if state.get(step.name) == 1:
+                raise ValueError(f"Startup steps have a cycle: {' -> '.join(path)}")
+            state[step.name] = 1
+            for dep in step.after:
+                if dep not in self.steps:
+                    raise ValueError(f"{step.name!r} depends on unknown step {dep!r}")
+                visit(self.steps[dep], path + (dep,))
+            state[step.name] = 2
+            ordered.append(step)
+
+        for step in self.steps.values():
+            visit(step, (step.name,))
+        return ordered
+
+    async def run(self):
+        """
+        |coro|
+
+        Runs every step and logs a timing breakdown once they are done.
+        """
+        start = time.perf_counter()
+        tasks: dict[str, asyncio.Task[None]] = {}
+
+        async def run_step(step: StartupStep):
+            if step.after:
+                await asyncio.gather(*(tasks[dep] for dep in step.after))
+            step.started = time.perf_counter() - start
+            await step.func()
+            step.finished = time.perf_counter() - start
+
+        for step in self._ordered():
+            tasks[step.name] = asyncio.create_task(
+                run_step(step), name=f"startup-{step.name}"
+            )
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        finally:
+            self.elapsed = time.perf_counter() - start
+
+        logger.info(self.report())
+
+    def report(self) -> str:
+        steps = sorted(self.steps.values(), key=lambda s: s.started or 0.0)
+        width = max((len(s.name) for s in steps), default=0)
+        total = sum(s.duration for s in steps)
+
+        lines = [
+            f"Startup finished in {self.elapsed * 1000:.0f}ms "
+            f"({total * 1000:.0f}ms of work across {len(steps)} steps)"
+        ]
+        for s in steps:
+            lines.append(
+                f"  {s.name:<{width}}  +{(s.started or 0) * 1000:>6.0f}ms  {s.duration * 1000:>6.0f}ms"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import codecs
+import re
+from logging import getLogger
+
+import aiohttp
+
+logger = getLogger("NASA.tiktok")
+
+__all__ = ("TikTokPoller", "TikTokError", "parse_follower_count")
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86-64; rv:90.0) Gecko/20100101 Firefox/90.0"
+)
+
+# The count shown on the profile, e.g. <strong title="Followers" ...>1.2M</strong>
+_DISPLAYED = re.compile(r'title="Followers"[^>]*>\s*([^<\s][^<]*?)\s*<')
+# The exact count in the page's embedded JSON, used if the markup changes. It has to
+# be followed by something else, or it could be a number cut off at the chunk's end
+_EMBEDDED = re.compile(r'"followerCount"\s*:\s*(\d+)(?=\D)')
+# Enough of the previous chunk to catch a match split between two chunks
+_OVERLAP = 512
+
+
+def _format_count(count: int) -> str:
+    # The way the profile shows counts, e.g. 1234567 is 1.2M, so the channel name
+    # doesn't change format depending on where the count was found
+    for divisor, suffix in ((10**9, "B"), (10**6, "M"), (10**3, "K")):
+        if count >= divisor:
+            whole, tenths = divmod(count * 10 // divisor, 10)
+            return f"{whole}.{tenths}{suffix}" if tenths else f"{whole}{suffix}"
+    return str(count)
+
+
+def parse_follower_count(html: str) -> str | None:
+    """Finds the follower count in a TikTok profile page, or a part of one"""
+    if match := _DISPLAYED.search(html):
+        return match.group(1)
+    if match := _EMBEDDED.search(html):
+        return _format_count(int(match.group(1)))
+    return None
+
+
+class TikTokError(Exception):
+    """Raised when the follower count couldn't be read"""
+
+
+class TikTokPoller:
+    """Reads a TikTok account's follower count from its profile page.
+
+    The page is streamed and searched chunk by chunk in a thread, so reading stops
+    as soon as the count is found. The ETag and Last-Modified headers of the last
+    response are sent back, so an unchanged page costs a 304.
+
+    Parameters
+    ----------
+    session: `aiohttp.ClientSession`
+        The session to make requests with
+    username: `str`
+        The account, without the @
+    base_url: `str`
+        Where profiles are served from
+    max_bytes: `int`
+        How much of the page to read before giving up
+    chunk_size: `int`
+        Bytes searched at a time
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        username: str,
+        *,
+        base_url: str = "https://www.tiktok.com",
+        max_bytes: int = 4 * 1024 * 1024,
+        chunk_size: int = 64 * 1024,
+    ):
+        self.session = session
+        self.username = username
+        self.base_url = base_url.rstrip("/")
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+
+        self.count: str | None = None
+        self.bytes_read = 0  # By the last poll
+        self._etag: str | None = None
+        self._last_modified: str | None = None
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/@{self.username}"
+
+    async def poll(self) -> str:
+        """
+        |coro|
+
+        Returns the follower count as it's shown on the profile.
+
+        Raises
+        ------
+        `TikTokError`
+            The request failed or the count wasn't in the page
+        """
+        headers = {"User-Agent": USER_AGENT}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+
+        self.bytes_read = 0
+        try:
+            async with self.session.get(
+                self.url, headers=headers, timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                if response.status == 304 and self.count is not None:
+                    return self.count
+                if response.status != 200:
+                    raise TikTokError(f"{self.url} returned {response.status}")
+
+                count = await self._search(response)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise TikTokError(f"Requesting {self.url} failed: {e}") from e
+
+        if count is None:
+            raise TikTokError(
+                f"No follower count in the first {self.bytes_read} bytes of {self.url}"
+            )
+
+        self.count = count
+        self._etag = etag
+        self._last_modified = last_modified
+        return count
+
+    async def _search(self, response: aiohttp.ClientResponse) -> str | None:
+        tail = ""
+        # Characters can be split between chunks
+        decoder = codecs.getincrementaldecoder("UTF-8")(errors="replace")
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            self.bytes_read += len(chunk)
+            text = tail + decoder.decode(chunk)
+            count = await asyncio.to_thread(parse_follower_count, text)
+            if count is not None:
+                # Leaving the context manager closes the connection on the rest of the page
+                return count
+            if self.bytes_read >= self.max_bytes:
+                break
+            tail = text[-_OVERLAP:]
+        return None
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import datetime
+import re
+
+from discord.ext import commands
+
+__all__ = ("parse_time",)
+
+_RELATIVE_RE = re.compile(r"^(?P<amount>\d+)(?P<unit>[smhdw])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_time(
+    value: str, *, tz: datetime.tzinfo | None = datetime.timezone.utc
+) -> datetime.datetime:
+    """Parses a time given in a command, either relative (e.g. ``30m``, ``7d``) or
+    an ISO date.
+
+    Parameters
+    ----------
+    value: `str`
+        What the user typed
+    tz: `Optional[datetime.tzinfo]`
+        The timezone of ISO dates that don't give one, local time if ``None``
+
+    Returns
+    -------
+    `datetime.datetime`
+        An aware datetime
+
+    Raises
+    ------
+    `commands.BadArgument`
+        The value isn't a time
+    """
+    match = _RELATIVE_RE.match(value.strip().lower())
+    if match:
+        seconds = int(match["amount"]) * _UNITS[match["unit"]]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return now - datetime.timedelta(seconds=seconds)
+
+    try:
+        parsed = datetime.datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise commands.BadArgument(
+            f"Invalid time {value!r}, use something like 30m, 7d or 2023-06-01"
+        )
+    if parsed.tzinfo is None:
+        # astimezone() on a naive datetime assumes it's local time
+        parsed = parsed.astimezone() if tz is None else parsed.replace(tzinfo=tz)
+    return parsed